@@ -0,0 +1,244 @@
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import MarketItem
+from price_history import DAY
+from shared_state import data_version, load_result, save_result
+from utils import market_hash_name, parse_item_name
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+DAYS_PER_YEAR = 365  # the Steam market trades every day
+ALLOCATION_GROUPS = ["weapon", "skin", "wear"]
+
+
+def split_item_name(item_name: str) -> Tuple[str, str, str]:
+    # "StatTrak™ AK-47 | Redline (Field-Tested)" -> ("AK-47", "Redline", "Field-Tested")
+    wear = parse_item_name(item_name)["wear"]
+    name = item_name[:-len(f" ({wear})")] if wear else item_name
+    for prefix in ("★ ", "StatTrak™ ", "Souvenir "):
+        name = name.replace(prefix, "")
+    weapon, _, skin = name.partition(" | ")
+    return weapon.strip(), skin.strip() or "Vanilla", wear or "Not painted"
+
+
+def factorize(values) -> Tuple[list, np.ndarray]:
+    # A dict is much cheaper than np.unique's sort for arrays of Python strings
+    index: Dict[str, int] = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int64, count=len(values))
+    return list(index), codes
+
+
+def load_positions(db: Session) -> Dict[str, np.ndarray]:
+    # Raw driver rows: going through the ORM's per-value type conversion costs more than all the maths below
+    rows = db.execute(text(
+        "SELECT purchase_date, item_name, item_link, number_of_items, total_cost, current_price, total_value "
+        "FROM inventory"
+    )).fetchall()
+    if not rows:
+        return {}
+    purchase_date, item_name, item_link, quantity, total_cost, current_price, total_value = zip(*rows)
+    # Lots without a purchase date count as bought on the earliest known date
+    days = np.array(purchase_date, dtype="datetime64[D]")
+    return {
+        "day": np.where(np.isnat(days), -1, days.astype(np.int64)),
+        "item_name": item_name,
+        "market": [market_hash_name(link) for link in item_link],
+        "quantity": np.array(quantity, dtype=np.float64),
+        "total_cost": np.array(total_cost, dtype=np.float64),
+        # Unpriced lots (NULL) have no value yet and no current price, which the code below takes as 0
+        "current_price": np.nan_to_num(np.array(current_price, dtype=np.float64)),
+        "total_value": np.nan_to_num(np.array(total_value, dtype=np.float64)),
+    }
+
+
+def load_daily_closes(db: Session, markets: list, first_day: int):
+    index = {name: position for position, name in enumerate(markets)}
+    market_ids = db.query(MarketItem.id, MarketItem.market_hash_name).all()
+    # Lookup table from market_items.id to the position in markets, -1 for markets no longer held
+    position_by_id = np.full(max((item_id for item_id, _ in market_ids), default=0) + 1, -1, dtype=np.int64)
+    for item_id, name in market_ids:
+        position_by_id[item_id] = index.get(name, -1)
+
+    rows = db.execute(
+        text("SELECT market_item_id, bucket_start, close_cents FROM price_history_daily WHERE bucket_start >= :start"),
+        {"start": first_day * DAY},
+    ).fetchall()
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+    item_id, bucket_start, close_cents = (np.array(column, dtype=np.int64) for column in zip(*rows))
+    market = position_by_id[np.clip(item_id, 0, len(position_by_id) - 1)]
+    held = market >= 0
+    return market[held], bucket_start[held] // DAY, close_cents[held] / 100
+
+
+def forward_fill(prices: np.ndarray) -> np.ndarray:
+    # Each cell takes the last observed (non-NaN) price to its left in the same row
+    columns = np.where(np.isnan(prices), 0, np.arange(prices.shape[1]))
+    np.maximum.accumulate(columns, axis=1, out=columns)
+    return prices[np.arange(prices.shape[0])[:, None], columns]
+
+
+def xirr(amounts: np.ndarray, years: np.ndarray) -> Optional[float]:
+    """Annual rate at which the cash flows have zero net present value, found by bisection."""
+    if not (amounts < 0).any() or not (amounts > 0).any():
+        return None
+
+    def npv(rate: float) -> float:
+        return float(np.sum(amounts * np.power(1 + rate, -years)))
+
+    low, high = -0.9999, 1.0
+    while npv(high) > 0 and high < 1e6:
+        high *= 10
+    if npv(low) * npv(high) > 0:
+        return None
+    for _ in range(200):
+        middle = (low + high) / 2
+        if npv(middle) > 0:
+            low = middle
+        else:
+            high = middle
+        if high - low < 1e-10:
+            break
+    return (low + high) / 2
+
+
+def allocation(positions: Dict[str, np.ndarray], total_value: float) -> Dict[str, List[dict]]:
+    # Names are parsed once per distinct item, then values are summed per group with bincount
+    names, name_index = factorize(positions["item_name"])
+    parts = [split_item_name(name) for name in names]
+    result = {}
+    for column, group in enumerate(ALLOCATION_GROUPS):
+        labels, part_index = factorize([part[column] for part in parts])
+        label_index = part_index[name_index]
+        values = np.bincount(label_index, weights=positions["total_value"], minlength=len(labels))
+        counts = np.bincount(label_index, minlength=len(labels))
+        order = np.argsort(-values, kind="stable")
+        result[group] = [
+            {"name": labels[i], "value": round(float(values[i]), 2), "positions": int(counts[i]),
+             "weight_percent": round(float(values[i]) / total_value * 100, 2) if total_value else 0.0}
+            for i in order
+        ]
+    return result
+
+
+def percent(value: Optional[float]) -> Optional[float]:
+    return round(value * 100, 2) if value is not None and np.isfinite(value) else None
+
+
+def compute_analytics(db: Session) -> dict:
+    positions = load_positions(db)
+    today = date.today()
+    if not positions:
+        return {"as_of": today, "start_date": None, "days": 0, "total_cost": 0.0, "total_value": 0.0,
+                "time_weighted_return_percent": None, "annualized_time_weighted_return_percent": None,
+                "money_weighted_return_percent": None, "max_drawdown_percent": None, "volatility_percent": None,
+                "allocation": {group: [] for group in ALLOCATION_GROUPS}}
+
+    last_day = today.toordinal() - EPOCH_ORDINAL
+    dated = positions["day"][positions["day"] >= 0]
+    first_day = int(min(dated.min(), last_day)) if dated.size else last_day
+    day = np.clip(np.where(positions["day"] < 0, first_day, positions["day"]), first_day, last_day) - first_day
+    days = last_day - first_day + 1
+
+    # One row per market item, one column per day
+    markets, market = factorize(positions["market"])
+    quantity = np.zeros((len(markets), days))
+    np.add.at(quantity, (market, day), positions["quantity"])
+    np.cumsum(quantity, axis=1, out=quantity)
+
+    prices = np.full((len(markets), days), np.nan)
+    close_market, close_day, close = load_daily_closes(db, markets, first_day)
+    in_window = close_day <= last_day
+    prices[close_market[in_window], close_day[in_window] - first_day] = close[in_window]
+    current = np.zeros(len(markets))
+    np.maximum.at(current, market, positions["current_price"])
+    prices[:, -1] = np.where(current > 0, current, prices[:, -1])
+
+    # Until a market's first recorded close its lots are carried at their average cost
+    held = np.bincount(market, weights=positions["quantity"], minlength=len(markets))
+    cost = np.bincount(market, weights=positions["total_cost"], minlength=len(markets))
+    average_cost = np.divide(cost, held, out=np.zeros_like(cost), where=held > 0)
+    prices = forward_fill(prices)
+    prices = np.where(np.isnan(prices), average_cost[:, None], prices)
+
+    value = (quantity * prices).sum(axis=0)
+    flows = np.bincount(day, weights=positions["total_cost"], minlength=days)
+
+    # Daily returns with purchases taken out; a day only counts once something was held the day before
+    previous = value[:-1]
+    active = previous > 0
+    returns = np.divide(value[1:] - flows[1:], previous, out=np.zeros_like(previous), where=active) - 1
+    returns = returns[active]
+
+    twr = annualized = drawdown = volatility = None
+    if returns.size:
+        growth = np.cumprod(1 + returns)
+        twr = growth[-1] - 1
+        # Annualizing less than a year of returns would extrapolate noise
+        if returns.size >= DAYS_PER_YEAR:
+            annualized = (1 + twr) ** (DAYS_PER_YEAR / returns.size) - 1
+        peak = np.maximum.accumulate(np.concatenate(([1.0], growth)))[1:]
+        drawdown = float(np.min(growth / peak - 1))
+        if returns.size > 1:
+            volatility = float(np.std(returns, ddof=1) * np.sqrt(DAYS_PER_YEAR))
+
+    # Money-weighted: every purchase is an outflow on its day, today's value the final inflow
+    flow_days = np.nonzero(flows)[0]
+    amounts = np.append(-flows[flow_days], value[-1])
+    years = np.append(flow_days, days - 1) / DAYS_PER_YEAR
+    mwr = xirr(amounts, years)
+
+    total_value = float(positions["total_value"].sum())
+    return {
+        "as_of": today,
+        "start_date": today - timedelta(days=days - 1),
+        "days": int(days),
+        "total_cost": round(float(positions["total_cost"].sum()), 2),
+        "total_value": round(total_value, 2),
+        "time_weighted_return_percent": percent(twr),
+        "annualized_time_weighted_return_percent": percent(annualized),
+        "money_weighted_return_percent": percent(mwr),
+        "max_drawdown_percent": percent(drawdown),
+        "volatility_percent": percent(volatility),
+        "allocation": allocation(positions, total_value),
+    }
+
+
+class AnalyticsCache:
+    """Keeps the last result until the inventory or the date changes. Results are also shared with the
+    other worker processes through the database, under the same version."""
+    shared_key = "portfolio_analytics"
+
+    def __init__(self, shared: bool = True):
+        self.shared = shared
+        self.key = None
+        self.result: Optional[dict] = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def data_version(db: Session) -> str:
+        return f"{date.today().isoformat()}:{data_version(db)}"
+
+    def get(self, db: Session) -> dict:
+        key = self.data_version(db)
+        with self.lock:
+            if key != self.key:
+                shared = load_result(self.shared_key, key) if self.shared else None
+                if shared is not None:
+                    self.result = orjson.loads(shared)
+                else:
+                    self.result = compute_analytics(db)
+                    if self.shared:
+                        save_result(self.shared_key, key, orjson.dumps(self.result))
+                self.key = key
+            return self.result
+
+
+analytics_cache = AnalyticsCache(settings.shared_cache_enabled)
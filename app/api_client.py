@@ -0,0 +1,107 @@
+import threading
+from typing import Callable, Optional, Set
+
+import requests
+from requests.adapters import HTTPAdapter
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+# Connect and read timeouts in seconds; nothing the UI asks for should take longer than this
+REQUEST_TIMEOUT = (3.05, 30)
+
+
+class RequestSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    done = pyqtSignal()
+
+
+class PendingRequest:
+    """Handle for an in-flight request. Once cancelled, its callbacks are never called."""
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self.signals = RequestSignals()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+class RequestTask(QRunnable):
+    def __init__(self, session: requests.Session, method: str, url: str, pending: PendingRequest, kwargs: dict):
+        super().__init__()
+        self.session = session
+        self.method = method
+        self.url = url
+        self.pending = pending
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            if self.pending.cancelled:
+                return
+            try:
+                response = self.session.request(self.method, self.url, **self.kwargs)
+            except requests.RequestException as exc:
+                if not self.pending.cancelled:
+                    self.pending.signals.failed.emit(str(exc))
+                return
+            if not self.pending.cancelled:
+                self.pending.signals.finished.emit(response)
+        finally:
+            self.pending.signals.done.emit()
+
+
+class ApiClient(QObject):
+    """Runs HTTP requests on a thread pool over one keep-alive session and reports back through
+    signals, which Qt delivers on the GUI thread. The UI thread never waits on the network."""
+
+    def __init__(self, parent=None, timeout=REQUEST_TIMEOUT, max_threads: int = 4):
+        super().__init__(parent)
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_threads)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        # Requests are kept alive here until their queued signals have been delivered on the GUI thread
+        self._pending: Set[PendingRequest] = set()
+
+    def request(self, method: str, url: str, on_success: Optional[Callable] = None,
+                on_error: Optional[Callable[[str], None]] = None, **kwargs) -> PendingRequest:
+        pending = PendingRequest()
+        if on_success is not None:
+            pending.signals.finished.connect(on_success)
+        if on_error is not None:
+            pending.signals.failed.connect(on_error)
+        pending.signals.done.connect(lambda: self._pending.discard(pending))
+        self._pending.add(pending)
+        kwargs.setdefault("timeout", self.timeout)
+        self.pool.start(RequestTask(self.session, method, url, pending, kwargs))
+        return pending
+
+    def get(self, url: str, **kwargs) -> PendingRequest:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> PendingRequest:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> PendingRequest:
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> PendingRequest:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> PendingRequest:
+        return self.request("DELETE", url, **kwargs)
+
+    def shutdown(self):
+        for pending in list(self._pending):
+            pending.cancel()
+        self.pool.clear()
+        self.pool.waitForDone(int(self.timeout[1] * 1000))
+        self.session.close()
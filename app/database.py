@@ -1,15 +1,103 @@
-from sqlalchemy import create_engine
+import os
+from pathlib import Path
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 from fastapi import Depends
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./inv_sqldatabase.db"
+from config import settings
+
+APP_DIR = Path(__file__).resolve().parent
+
+# asyncio drivers for the async engine, by backend; pip install asyncpg for PostgreSQL
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def resolve_database_url(url: str) -> URL:
+    # A relative SQLite path is anchored to the app directory, so the same file is used whatever the working directory
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:" \
+            and not os.path.isabs(url.database):
+        url = url.set(database=str(APP_DIR / url.database))
+    return url
+
+
+def sqlite_pragmas() -> dict:
+    return {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "busy_timeout": settings.sqlite_busy_timeout,
+        "cache_size": settings.sqlite_cache_size,
+        "mmap_size": settings.sqlite_mmap_size,
+    }
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Runs once per pooled connection; journal_mode=wal is persistent, the rest are per connection
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def engine_options(url: URL, queue_pool=QueuePool) -> dict:
+    if url.get_backend_name() == "sqlite":
+        if not url.database or url.database == ":memory:":
+            # Every connection would get its own empty in-memory database, so share one
+            return {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+        # Pooled connections keep their page cache and memory map between requests; each one is still
+        # used by a single thread at a time, which is all check_same_thread guards against
+        return {
+            "connect_args": {"check_same_thread": False, "timeout": settings.sqlite_busy_timeout / 1000},
+            "poolclass": queue_pool,
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout,
+        }
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+    # Server databases such as PostgreSQL (pip install psycopg2-binary and set DATABASE_URL)
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": True,
+    }
+
+
+def build_engine(url: URL):
+    engine = create_engine(url, **engine_options(url))
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def build_async_engine(url: URL):
+    backend = url.get_backend_name()
+    async_url = url.set(drivername=ASYNC_DRIVERS.get(backend, url.drivername))
+    engine = create_async_engine(async_url, **engine_options(url, queue_pool=AsyncAdaptedQueuePool))
+    if backend == "sqlite":
+        event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+SQLALCHEMY_DATABASE_URL = resolve_database_url(settings.database_url).render_as_string(hide_password=False)
+
+engine = build_engine(make_url(SQLALCHEMY_DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async routes share the database but never wait on it on the event loop. Their sessions wrap a
+# SessionLocal session, so the listeners installed on SessionLocal (item events, metrics) see both.
+# Objects stay loaded after commit: reloading an expired attribute would need I/O outside the greenlet.
+async_engine = build_async_engine(make_url(SQLALCHEMY_DATABASE_URL))
+
+AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, sync_session_class=SessionLocal,
+                                 expire_on_commit=False)
+
 Base = declarative_base()
 
 # Dependency
@@ -20,3 +108,7 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
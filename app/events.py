@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from typing import List, Optional, Set, Tuple
+
+import orjson
+from sqlalchemy import delete, event, func, insert, select, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from config import settings
+from database import engine
+from models import Inventory, SharedEvent
+from schemas import InventoryResponse
+
+EVENT_RETENTION = 60.0  # seconds relayed events are kept for workers that are slow to poll
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """Fans events out to every connected subscriber. publish() may be called from any thread.
+    With the relay started, events also go through the shared_events table to the other worker processes,
+    and theirs come back the same way, so every /events stream sees every event whichever worker it is on."""
+
+    def __init__(self, queue_size: int = 1000):
+        self.queue_size = queue_size
+        self.origin = uuid.uuid4().hex
+        self._subscribers: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = set()
+        self._lock = threading.Lock()
+        self._outbox: List[dict] = []
+        self._cursor = 0
+        self._pruned_at = 0.0
+        self._relay_stop = threading.Event()
+        self._relay_thread: Optional[threading.Thread] = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers = {(loop, q) for loop, q in self._subscribers if q is not queue}
+
+    def publish(self, event: dict):
+        self._fan_out(event)
+        if self._relay_thread is not None:
+            # Written by the relay thread, so publishers never wait on the database
+            with self._lock:
+                if len(self._outbox) >= self.queue_size:
+                    self._outbox = [{"type": "resync"}]
+                else:
+                    self._outbox.append(event)
+
+    def _fan_out(self, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has already shut down
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, event: dict):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A subscriber this far behind is better off reloading everything
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "resync"})
+
+    def start_relay(self):
+        # Only events published from now on are relayed
+        with engine.connect() as conn:
+            self._cursor = conn.execute(select(func.max(SharedEvent.id))).scalar() or 0
+        self._relay_thread = threading.Thread(target=self._relay, name="event-relay", daemon=True)
+        self._relay_thread.start()
+
+    def stop_relay(self):
+        self._relay_stop.set()
+        if self._relay_thread is not None:
+            self._relay_thread.join(timeout=5)
+            self._relay_thread = None
+
+    def _relay(self):
+        # A last pass after stop_relay() sends the events published while shutting down
+        while True:
+            stopping = self._relay_stop.wait(settings.shared_events_interval)
+            try:
+                self.relay_once()
+            except Exception:
+                logger.exception("Relaying events between workers failed")
+            if stopping:
+                return
+
+    def relay_once(self):
+        with self._lock:
+            outgoing, self._outbox = self._outbox, []
+        now = time.time()
+        try:
+            with engine.begin() as conn:
+                if outgoing:
+                    if conn.dialect.name == "postgresql":
+                        # Ids must become visible in order or a reader could move its cursor past one still
+                        # uncommitted; SQLite serialises writers anyway, and this still lets readers through
+                        conn.execute(text("LOCK TABLE shared_events IN EXCLUSIVE MODE"))
+                    conn.execute(insert(SharedEvent), [
+                        {"origin": self.origin, "payload": orjson.dumps(event), "created_at": now}
+                        for event in outgoing
+                    ])
+                incoming = conn.execute(
+                    select(SharedEvent.id, SharedEvent.origin, SharedEvent.payload)
+                    .where(SharedEvent.id > self._cursor).order_by(SharedEvent.id)
+                ).all()
+                if now - self._pruned_at > EVENT_RETENTION:
+                    conn.execute(delete(SharedEvent).where(SharedEvent.created_at < now - EVENT_RETENTION))
+                    self._pruned_at = now
+        except Exception:
+            # Sent again on the next pass
+            with self._lock:
+                self._outbox[:0] = outgoing
+            raise
+        for event_id, origin, payload in incoming:
+            self._cursor = event_id
+            if origin != self.origin:
+                self._fan_out(orjson.loads(payload))
+
+
+event_bus = EventBus()
+
+
+def item_event(event_type: str, item: Inventory) -> dict:
+    return {"type": event_type, "item": InventoryResponse.model_validate(item, from_attributes=True).model_dump(mode="json")}
+
+
+def _collect_item_events(session: Session, flush_context):
+    events: List[dict] = session.info.setdefault("pending_events", [])
+    for item in session.new:
+        if isinstance(item, Inventory):
+            events.append(item_event("item.created", item))
+    for item in session.dirty:
+        if isinstance(item, Inventory) and session.is_modified(item):
+            events.append(item_event("item.updated", item))
+    for item in session.deleted:
+        if isinstance(item, Inventory):
+            events.append({"type": "item.deleted", "item_number": item.item_number})
+
+
+def _publish_item_events(session: Session):
+    for pending in session.info.pop("pending_events", []):
+        event_bus.publish(pending)
+
+
+def _discard_item_events(session: Session):
+    session.info.pop("pending_events", None)
+
+
+def install_session_events(session_factory: sessionmaker):
+    # Row-level change events are gathered at flush time and only published once the transaction commits
+    event.listen(session_factory, "after_flush", _collect_item_events)
+    event.listen(session_factory, "after_commit", _publish_item_events)
+    event.listen(session_factory, "after_rollback", _discard_item_events)
@@ -0,0 +1,89 @@
+"""Local stand-in for Steam's priceoverview endpoint, for exercising the refresh path offline.
+
+Usage: python fake_price_server.py [--port 8001] [--latency 0.2] [--jitter 0.1]
+                                   [--error-rate 0.05] [--rate-limit-rate 0.05] [--retry-after 2]
+
+Then start the API with PRICE_PROVIDER_URL=http://localhost:8001/market/priceoverview/.
+
+Every item gets a stable price derived from its name. Each request sleeps for latency plus up to jitter
+seconds, then fails with a 500 with probability error-rate or a 429 with probability rate-limit-rate.
+"""
+import argparse
+import hashlib
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_price(name: str) -> float:
+    digest = int(hashlib.sha1(name.encode()).hexdigest()[:8], 16)
+    return round(0.03 + (digest % 250000) / 100, 2)
+
+
+class FakePriceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle on, keep-alive clients wait ~40ms on each reply
+    disable_nagle_algorithm = True
+    options: argparse.Namespace
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/market/priceoverview":
+            return self.respond(404, {"success": False})
+
+        options = self.options
+        time.sleep(options.latency + random.uniform(0, options.jitter))
+        roll = random.random()
+        if roll < options.error_rate:
+            return self.respond(500, {"success": False})
+        if roll < options.error_rate + options.rate_limit_rate:
+            return self.respond(429, None, {"Retry-After": str(options.retry_after)})
+
+        name = parse_qs(url.query).get("market_hash_name", [""])[0]
+        if not name:
+            return self.respond(200, {"success": False})
+        price = fake_price(name)
+        self.respond(200, {"success": True, "lowest_price": f"${price:,.2f}", "volume": "100",
+                           "median_price": f"${price:,.2f}"})
+
+    def respond(self, status: int, body, headers: dict = None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if not self.options.quiet:
+            super().log_message(format, *args)
+
+
+def serve(port: int, options: argparse.Namespace):
+    FakePriceHandler.options = options
+    server = ThreadingHTTPServer(("localhost", port), FakePriceHandler)
+    server.daemon_threads = True
+    print(f"Fake price provider on http://localhost:{port}/market/priceoverview/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Steam price provider")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.1, help="up to this many extra seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=2, help="Retry-After sent with 429s")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+    serve(args.port, args)
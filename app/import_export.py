@@ -0,0 +1,222 @@
+import csv
+import io
+from functools import lru_cache
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import Date, DateTime, Integer, String, insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Inventory
+from refresh import fetch_prices
+from schemas import ImportRow
+from services import serialize_row
+from utils import name_finder
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+IMPORT_FIELDS = ["item_link", "number_of_items", "cost_per_item", "purchase_date", "current_price"]
+REQUIRED_IMPORT_FIELDS = ["item_link", "number_of_items", "cost_per_item"]
+MAX_REPORTED_ERRORS = 100
+
+# Spreadsheets repeat the same few thousand listings, so each link is only unquoted once
+item_name = lru_cache(maxsize=100000)(name_finder)
+
+
+def row_chunks(query, chunk_size: int) -> Iterator[list]:
+    # yield_per keeps a single chunk of rows in memory, however large the export
+    chunk = []
+    for row in query.yield_per(chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_csv(query, columns: list, chunk_size: int = 1000) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in columns])
+    for chunk in row_chunks(query, chunk_size):
+        writer.writerows(serialize_row(row).values() for row in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def require_arrow():
+    # Parquet and Arrow exports are optional, and pyarrow is only imported by the first one
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail="Parquet and Arrow exports need pyarrow installed on the server")
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema(columns: list) -> "pyarrow.Schema":
+    pa, _ = require_arrow()
+
+    def arrow_type(column):
+        if isinstance(column.type, Integer):
+            return pa.int64()
+        if isinstance(column.type, DateTime):
+            return pa.timestamp("us")
+        if isinstance(column.type, Date):
+            return pa.date32()
+        if isinstance(column.type, String):
+            return pa.string()
+        return pa.float64()
+    return pa.schema([(column.key, arrow_type(column)) for column in columns])
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # Parquet records absolute offsets in its footer, so the position keeps counting across drains
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_arrow(query, columns: list, format: str, chunk_size: int = 10000) -> Iterator[bytes]:
+    # Each chunk becomes one Parquet row group or one Arrow IPC record batch
+    pa, pq = require_arrow()
+    schema = arrow_schema(columns)
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if format == "parquet" else pa.ipc.new_stream(sink, schema)
+    for chunk in row_chunks(query, chunk_size):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(query, columns: list, format: str) -> Iterator[bytes]:
+    if format == "csv":
+        return stream_csv(query, columns)
+    return stream_arrow(query, columns, format)
+
+
+def import_record(row: ImportRow, current_price: Optional[float], priced_at: Optional[datetime]) -> dict:
+    total_cost = round(row.number_of_items * row.cost_per_item, 2)
+    values = {"total_value": None, "total_return_dollar": None, "total_return_percent": None}
+    if current_price is not None:
+        total_value = round(row.number_of_items * current_price, 2)
+        total_return_dollar = round(total_value - total_cost, 2)
+        values = {"total_value": total_value, "total_return_dollar": total_return_dollar,
+                  "total_return_percent": round(total_return_dollar / total_cost * 100, 2)}
+    return {
+        "purchase_date": row.purchase_date or date.today(),
+        "item_name": item_name(row.item_link),
+        "cost_per_item": row.cost_per_item,
+        "number_of_items": row.number_of_items,
+        "total_cost": total_cost,
+        "current_price": current_price,
+        **values,
+        "item_link": row.item_link,
+        "last_priced_at": priced_at,
+    }
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def fail(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self) -> dict:
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+
+def insert_batch(db: Session, batch: List[Tuple[int, ImportRow]], fetch: bool, result: ImportResult):
+    prices: Dict[str, Optional[float]] = {}
+    priced_at = None
+    if fetch:
+        prices = dict(fetch_prices(row.item_link for _, row in batch))
+        priced_at = datetime.utcnow()
+
+    records = []
+    for line, row in batch:
+        if fetch:
+            if prices.get(row.item_link) is None:
+                result.fail(line, "Price lookup failed")
+                continue
+            records.append(import_record(row, prices[row.item_link], priced_at))
+        else:
+            # Deferred rows keep the file's price, if any. Without one they are stored unpriced (NULL), which
+            # keeps them out of the value totals until the refresh started after the import prices them.
+            records.append(import_record(row, row.current_price, None))
+
+    if records:
+        db.execute(insert(Inventory.__table__), records)
+        db.commit()
+        result.imported += len(records)
+
+
+def validation_message(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors())
+
+
+def import_csv(db: Session, text_file: TextIO, fetch: bool = False, batch_size: Optional[int] = None) -> ImportResult:
+    """Validate CSV rows and insert them batch by batch, each batch in its own transaction.
+
+    Invalid rows are skipped and reported by line number; the valid rows around them are still imported.
+    """
+    batch_size = batch_size or settings.import_batch_size
+    reader = csv.DictReader(text_file)
+    missing = [field for field in REQUIRED_IMPORT_FIELDS if field not in (reader.fieldnames or [])]
+    if missing:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Missing CSV columns: {', '.join(missing)}")
+
+    result = ImportResult()
+    batch: List[Tuple[int, ImportRow]] = []
+    for record in reader:
+        # Empty cells mean "not given", so optional columns fall back to their defaults
+        values = {field: record[field].strip() for field in IMPORT_FIELDS if (record.get(field) or "").strip()}
+        try:
+            batch.append((reader.line_num, ImportRow(**values)))
+        except ValidationError as exc:
+            result.fail(reader.line_num, validation_message(exc))
+            continue
+        if len(batch) >= batch_size:
+            insert_batch(db, batch, fetch, result)
+            batch = []
+    if batch:
+        insert_batch(db, batch, fetch, result)
+    return result
@@ -1,37 +1,44 @@
-from fastapi import FastAPI
-from routers import router
-from models import Inventory
-from database import engine
+"""Starts the inventory manager.
 
-from ui import MainWindow
+    python main.py                API server and desktop UI, each in its own process
+    python main.py serve          API server only; never imports Qt
+    python main.py gui            desktop UI only, against a server that is already running
+    python main.py migrate        upgrade the database and rebuild derived tables, then exit
+
+serve takes --host, --port, --workers and --reload; they default to the SERVER_* settings.
+"""
+import argparse
+import logging
 import sys
-from PyQt5.QtWidgets import QApplication
-from multiprocessing import Process, Event  
+from multiprocessing import Process, Event
 
 
-app = FastAPI()
+def run_fastapi(stop_event=None, host: str = None, port: int = None, reload: bool = None, workers: int = None):
+    # The API modules are imported here rather than at the top, so the UI process never loads them
+    from server import serve
+    serve(host, port, reload, workers)
+    if stop_event is not None:
+        stop_event.set()
 
-# Add the router to the app
-app.include_router(router)
 
-# Create the database tables (if needed)
-Inventory.metadata.create_all(bind=engine)
+def run_migrate():
+    from server import prepare_database
+    prepare_database()
 
-def run_fastapi(stop_event):
-    import uvicorn
-    uvicorn.run("main:app", host="localhost", port=8000, reload=True, lifespan="on")
-    stop_event.set()
 
+def run_ui(stop_event=None):
+    from PyQt5.QtWidgets import QApplication
+    from ui import MainWindow
 
-def run_ui(stop_event):
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
-    window.destroyed.connect(stop_event.set)
+    if stop_event is not None:
+        window.destroyed.connect(stop_event.set)
     sys.exit(app.exec_())
 
 
-if __name__ == '__main__':
+def run_desktop():
     stop_event = Event()
 
     fastapi_process = Process(target=run_fastapi, args=(stop_event,))
@@ -42,4 +49,28 @@ if __name__ == '__main__':
 
     stop_event.wait()  # Wait for either the UI or FastAPI to be closed
     fastapi_process.terminate()
-    ui_process.terminate()
\ No newline at end of file
+    ui_process.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="CS investment manager")
+    commands = parser.add_subparsers(dest="command")
+    serve_parser = commands.add_parser("serve", help="run the API server without the UI")
+    serve_parser.add_argument("--host")
+    serve_parser.add_argument("--port", type=int)
+    serve_parser.add_argument("--workers", type=int, help="worker processes serving the API")
+    serve_parser.add_argument("--reload", action="store_true", default=None,
+                              help="restart when the source changes, for development")
+    commands.add_parser("gui", help="run the UI against an already running server")
+    commands.add_parser("migrate", help="prepare the database ahead of starting servers that do not")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(message)s")
+
+    if args.command == "serve":
+        run_fastapi(host=args.host, port=args.port, reload=args.reload, workers=args.workers)
+    elif args.command == "gui":
+        run_ui()
+    elif args.command == "migrate":
+        run_migrate()
+    else:
+        run_desktop()
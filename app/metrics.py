@@ -0,0 +1,254 @@
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500, 1000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(header + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Per label set: a count for each bucket (not cumulative), the sum and the total count
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, totals = self._values.setdefault(key, ([0] * len(self.buckets), [0.0, 0]))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            totals[0] += value
+            totals[1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), list(totals))) for key, (counts, totals) in self._values.items())
+        lines = []
+        for key, (counts, (total, count)) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status.",
+                                 ["method", "route", "status"])
+http_request_duration = registry.histogram("http_request_duration_seconds", "Time to answer an HTTP request.",
+                                           ["method", "route"])
+http_request_sql_queries = registry.histogram("http_request_sql_queries", "SQL statements issued per HTTP request.",
+                                              ["method", "route"], buckets=COUNT_BUCKETS)
+sql_queries = registry.counter("sql_queries_total", "SQL statements executed, by operation.", ["operation"])
+sql_query_duration = registry.histogram("sql_query_duration_seconds", "SQL statement execution time.",
+                                        ["operation"], buckets=SQL_BUCKETS)
+db_sessions_active = registry.gauge("db_sessions_active", "Sessions currently holding a transaction.")
+db_session_duration = registry.histogram("db_session_duration_seconds",
+                                         "Time a session holds its transaction, from first use to commit, "
+                                         "rollback or close.")
+price_fetches = registry.counter("price_fetch_total", "Upstream price requests by outcome.", ["outcome"])
+price_fetch_duration = registry.histogram("price_fetch_duration_seconds", "Upstream price request latency.",
+                                          ["outcome"])
+refresh_jobs = registry.counter("refresh_jobs_total", "Finished price refresh jobs by status.", ["status"])
+refresh_items = registry.counter("refresh_items_total", "Inventory rows handled by refresh jobs, by outcome.",
+                                 ["outcome"])
+refresh_duration = registry.histogram("refresh_job_duration_seconds", "Price refresh job run time.",
+                                      buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+refresh_throughput = registry.gauge("refresh_last_items_per_second", "Rows per second of the last finished refresh.")
+
+# SQL statements issued while handling the current request; None outside requests
+_request_queries: ContextVar[Optional[List[int]]] = ContextVar("request_queries", default=None)
+
+# Long-lived streams would swamp the latency histogram, so they are only counted
+UNTIMED_ROUTES = {"/events"}
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        queries = [0]
+        token = _request_queries.set(queries)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_queries.reset(token)
+            # Label by route template, never the raw path, to keep the number of series bounded
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            http_requests.inc(method=method, route=path, status=status)
+            if path not in UNTIMED_ROUTES:
+                http_request_duration.observe(elapsed, method=method, route=path)
+                http_request_sql_queries.observe(queries[0], method=method, route=path)
+
+
+def _operation(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return keyword if keyword in ("select", "insert", "update", "delete") else "other"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    operation = _operation(statement)
+    sql_queries.inc(operation=operation)
+    sql_query_duration.observe(time.perf_counter() - started, operation=operation)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _session_begin(session, transaction):
+    if transaction.parent is None:
+        session.info["transaction_started"] = time.perf_counter()
+        db_sessions_active.inc()
+
+
+def _session_end(session, transaction):
+    if transaction.parent is None:
+        started = session.info.pop("transaction_started", None)
+        if started is not None:
+            db_sessions_active.dec()
+            db_session_duration.observe(time.perf_counter() - started)
+
+
+def install_metrics(session_factory: sessionmaker, *engines: Engine):
+    # Pass an AsyncEngine's sync_engine; its statements run on the same events
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+    event.listen(session_factory, "after_transaction_create", _session_begin)
+    event.listen(session_factory, "after_transaction_end", _session_end)
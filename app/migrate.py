@@ -0,0 +1,198 @@
+"""Upgrade an existing inventory database in place.
+
+Usage: python migrate.py [path/to/inv_sqldatabase.db]
+
+Databases created before the inventory columns were typed store every number as text and
+purchase_date as an MM/DD/YYYY string. The rows are converted inside a single transaction and
+read back to check that no value changed; on any mismatch the transaction is rolled back.
+Columns added to Inventory since the database was created are added as well, and the table is
+rebuilt when it still has NOT NULL on columns that now allow NULL (the price columns of unpriced
+lots). A copy of the original file is kept next to it as <name>.bak before anything is changed.
+Indexes declared on Inventory that the database lacks are created last.
+
+The server runs this on startup, so running it by hand is only needed to migrate ahead of time.
+"""
+import shutil
+import sqlite3
+import sys
+from datetime import datetime
+from typing import List
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from database import SQLALCHEMY_DATABASE_URL
+from models import Inventory
+
+MONEY_COLUMNS = ["cost_per_item", "total_cost", "current_price", "total_value", "total_return_dollar",
+                 "total_return_percent"]
+
+
+class MigrationError(Exception):
+    pass
+
+
+def column_types(conn: sqlite3.Connection, table: str) -> dict:
+    return {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def needs_numeric_migration(conn: sqlite3.Connection) -> bool:
+    types = column_types(conn, "inventory")
+    return bool(types) and types.get("cost_per_item", "").startswith("VARCHAR")
+
+
+def parse_legacy_date(value):
+    if value is None or value == "":
+        return None
+    return datetime.strptime(value, "%m/%d/%Y").date()
+
+
+def convert_row(row: sqlite3.Row) -> dict:
+    number_of_items = float(row["number_of_items"])
+    if not number_of_items.is_integer():
+        raise MigrationError(f"Item {row['item_number']}: number_of_items {row['number_of_items']!r} is not whole")
+
+    converted = {
+        "item_number": row["item_number"],
+        "purchase_date": parse_legacy_date(row["purchase_date"]),
+        "item_name": row["item_name"],
+        "number_of_items": int(number_of_items),
+        "item_link": row["item_link"],
+    }
+    for column in MONEY_COLUMNS:
+        converted[column] = float(row[column])
+    return converted
+
+
+def validate(conn: sqlite3.Connection, expected: dict):
+    rows = conn.execute("SELECT * FROM inventory").fetchall()
+    if len(rows) != len(expected):
+        raise MigrationError(f"Row count changed from {len(expected)} to {len(rows)}")
+
+    for row in rows:
+        original = expected[row["item_number"]]
+        stored_date = row["purchase_date"]
+        if original["purchase_date"] != (datetime.strptime(stored_date, "%Y-%m-%d").date() if stored_date else None):
+            raise MigrationError(f"Item {row['item_number']}: purchase_date changed")
+        for column in ["item_name", "item_link", "number_of_items"] + MONEY_COLUMNS:
+            if row[column] != original[column]:
+                raise MigrationError(
+                    f"Item {row['item_number']}: {column} changed from {original[column]!r} to {row[column]!r}")
+
+
+def migrate_numeric_columns(conn: sqlite3.Connection) -> int:
+    legacy_rows = conn.execute("SELECT * FROM inventory").fetchall()
+    expected = {}
+    for row in legacy_rows:
+        converted = convert_row(row)
+        expected[converted["item_number"]] = converted
+
+    conn.execute("ALTER TABLE inventory RENAME TO inventory_legacy")
+    conn.execute(str(CreateTable(Inventory.__table__).compile(dialect=sqlite.dialect())))
+
+    columns = list(next(iter(expected.values())).keys()) if expected else ["item_number"]
+    placeholders = ", ".join(f":{column}" for column in columns)
+    conn.executemany(
+        f"INSERT INTO inventory ({', '.join(columns)}) VALUES ({placeholders})",
+        [{**row, "purchase_date": row["purchase_date"].isoformat() if row["purchase_date"] else None}
+         for row in expected.values()],
+    )
+
+    validate(conn, expected)
+    conn.execute("DROP TABLE inventory_legacy")
+    return len(expected)
+
+
+def missing_columns(conn: sqlite3.Connection) -> list:
+    existing = column_types(conn, "inventory")
+    return [column for column in Inventory.__table__.columns if column.key not in existing]
+
+
+def add_missing_columns(conn: sqlite3.Connection) -> List[str]:
+    added = []
+    for column in missing_columns(conn):
+        column_type = column.type.compile(dialect=sqlite.dialect())
+        conn.execute(f"ALTER TABLE inventory ADD COLUMN {column.key} {column_type}")
+        added.append(column.key)
+    return added
+
+
+def relaxed_columns(conn: sqlite3.Connection) -> list:
+    # SQLite cannot drop a NOT NULL constraint in place, so these need the table rebuilt
+    not_null = {row[1] for row in conn.execute("PRAGMA table_info(inventory)") if row[3]}
+    return [column.key for column in Inventory.__table__.columns
+            if column.nullable and not column.primary_key and column.key in not_null]
+
+
+def rebuild_table(conn: sqlite3.Connection) -> int:
+    columns = ", ".join(column.key for column in Inventory.__table__.columns)
+    count = conn.execute("SELECT COUNT(*) FROM inventory").fetchone()[0]
+    conn.execute("ALTER TABLE inventory RENAME TO inventory_legacy")
+    conn.execute(str(CreateTable(Inventory.__table__).compile(dialect=sqlite.dialect())))
+    conn.execute(f"INSERT INTO inventory ({columns}) SELECT {columns} FROM inventory_legacy")
+    rebuilt = conn.execute("SELECT COUNT(*) FROM inventory").fetchone()[0]
+    if rebuilt != count:
+        raise MigrationError(f"Row count changed from {count} to {rebuilt}")
+    # Its indexes and triggers go with it; the indexes are created again below, the triggers on startup
+    conn.execute("DROP TABLE inventory_legacy")
+    return count
+
+
+def missing_indexes(conn: sqlite3.Connection) -> list:
+    existing = {row[1] for row in conn.execute("PRAGMA index_list(inventory)")}
+    return [index for index in Inventory.__table__.indexes if index.name not in existing]
+
+
+def create_missing_indexes(conn: sqlite3.Connection) -> List[str]:
+    created = []
+    for index in missing_indexes(conn):
+        conn.execute(str(CreateIndex(index).compile(dialect=sqlite.dialect())))
+        created.append(index.name)
+    return created
+
+
+def migrate(db_path: str) -> List[str]:
+    """Bring the database at db_path up to date and describe what was done."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        if not column_types(conn, "inventory"):
+            return []
+        numeric = needs_numeric_migration(conn)
+        if not numeric and not missing_columns(conn) and not relaxed_columns(conn) and not missing_indexes(conn):
+            return []
+
+        shutil.copy2(db_path, f"{db_path}.bak")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            steps = []
+            if numeric:
+                count = migrate_numeric_columns(conn)
+                steps.append(f"Migrated {count} items to numeric and date columns.")
+            added = add_missing_columns(conn)
+            if added:
+                steps.append(f"Added columns: {', '.join(added)}.")
+            relaxed = relaxed_columns(conn)
+            if relaxed:
+                count = rebuild_table(conn)
+                steps.append(f"Rebuilt inventory ({count} items) to allow NULL in: {', '.join(relaxed)}.")
+            created = create_missing_indexes(conn)
+            if created:
+                steps.append(f"Created indexes: {', '.join(created)}.")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return steps
+    finally:
+        conn.close()
+
+
+def sqlite_path(url: str = SQLALCHEMY_DATABASE_URL):
+    return url.replace("sqlite:///", "", 1) if url.startswith("sqlite:///") else None
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[1] if len(sys.argv) > 1 else sqlite_path()
+    steps = migrate(db_path)
+    print("\n".join(steps) if steps else f"{db_path} is already up to date.")
@@ -1,22 +1,386 @@
-from sqlalchemy import DateTime, Column, Integer, String, Numeric
-from datetime import datetime
+from sqlalchemy import DDL, Date, DateTime, Column, Float, Integer, LargeBinary, String, Numeric, TypeDecorator, event
+from datetime import date
 
 from database import Base
+from utils import WEARS
+
+
+class Money(TypeDecorator):
+    # Stored as exact decimals in the database but always handed to Python as floats, which is what the API speaks
+    impl = Numeric
+    cache_ok = True
+
+    def __init__(self, precision: int = 14, scale: int = 2):
+        super().__init__(precision, scale, asdecimal=False)
+
+    def process_result_value(self, value, dialect):
+        return float(value) if value is not None else None
 
 
 class Inventory(Base):
     __tablename__ = "inventory"
 
     item_number = Column(Integer, primary_key=True, autoincrement=True, nullable=False)
-    # purchase_date = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
-    purchase_date = Column(String(10))
+    purchase_date = Column(Date, default=date.today, index=True)
+    item_name = Column(String, nullable=False)
+    cost_per_item = Column(Money(), nullable=False)
+    number_of_items = Column(Integer, nullable=False)
+    total_cost = Column(Money(), nullable=False)
+    # NULL until the lot is first priced (e.g. imported with pricing deferred), never a placeholder 0
+    current_price = Column(Money(), index=True)
+    total_value = Column(Money(), index=True)
+    total_return_dollar = Column(Money())
+    total_return_percent = Column(Money(10, 2), index=True)
+    item_link = Column(String, nullable=False, index=True)
+    last_priced_at = Column(DateTime)
+
+
+class MarketItem(Base):
+    __tablename__ = "market_items"
+
+    id = Column(Integer, primary_key=True)
+    market_hash_name = Column(String, nullable=False, unique=True)
+
+
+class PriceHistory(Base):
+    """Raw price observations as integer cents at unix seconds, clustered by market item and time."""
+    __tablename__ = "price_history"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    market_item_id = Column(Integer, primary_key=True)
+    observed_at = Column(Integer, primary_key=True)
+    price_cents = Column(Integer, nullable=False)
+
+
+class PriceRollup:
+    market_item_id = Column(Integer, primary_key=True)
+    bucket_start = Column(Integer, primary_key=True)
+    open_cents = Column(Integer, nullable=False)
+    high_cents = Column(Integer, nullable=False)
+    low_cents = Column(Integer, nullable=False)
+    close_cents = Column(Integer, nullable=False)
+    samples = Column(Integer, nullable=False)
+
+
+class HourlyPrice(PriceRollup, Base):
+    __tablename__ = "price_history_hourly"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+class DailyPrice(PriceRollup, Base):
+    __tablename__ = "price_history_daily"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+class PortfolioTotals(Base):
+    """Single-row running totals over the whole inventory, maintained by triggers on inventory."""
+    __tablename__ = "portfolio_totals"
+
+    id = Column(Integer, primary_key=True)
+    lot_count = Column(Integer, nullable=False, default=0)
+    item_count = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Money(), nullable=False, default=0)
+    total_value = Column(Money(), nullable=False, default=0)
+    total_return_dollar = Column(Money(), nullable=False, default=0)
+
+
+# Triggers are dropped and created again on startup, so a database always runs the current definitions.
+# Unpriced lots have NULL values, which the totals leave out.
+PORTFOLIO_TOTALS_DDL = [
+    # Resynchronise on every startup so the running totals can never drift from the rows they summarise
+    """
+    INSERT OR REPLACE INTO portfolio_totals (id, lot_count, item_count, total_cost, total_value, total_return_dollar)
+    SELECT 1, COUNT(*), COALESCE(SUM(number_of_items), 0), COALESCE(SUM(total_cost), 0),
+           COALESCE(SUM(total_value), 0), COALESCE(SUM(total_return_dollar), 0)
+    FROM inventory
+    """,
+    "DROP TRIGGER IF EXISTS portfolio_totals_insert",
+    """
+    CREATE TRIGGER portfolio_totals_insert AFTER INSERT ON inventory BEGIN
+        UPDATE portfolio_totals SET
+            lot_count = lot_count + 1,
+            item_count = item_count + new.number_of_items,
+            total_cost = total_cost + new.total_cost,
+            total_value = total_value + coalesce(new.total_value, 0),
+            total_return_dollar = total_return_dollar + coalesce(new.total_return_dollar, 0)
+        WHERE id = 1;
+    END
+    """,
+    "DROP TRIGGER IF EXISTS portfolio_totals_delete",
+    """
+    CREATE TRIGGER portfolio_totals_delete AFTER DELETE ON inventory BEGIN
+        UPDATE portfolio_totals SET
+            lot_count = lot_count - 1,
+            item_count = item_count - old.number_of_items,
+            total_cost = total_cost - old.total_cost,
+            total_value = total_value - coalesce(old.total_value, 0),
+            total_return_dollar = total_return_dollar - coalesce(old.total_return_dollar, 0)
+        WHERE id = 1;
+    END
+    """,
+    "DROP TRIGGER IF EXISTS portfolio_totals_update",
+    """
+    CREATE TRIGGER portfolio_totals_update
+    AFTER UPDATE OF number_of_items, total_cost, total_value, total_return_dollar ON inventory BEGIN
+        UPDATE portfolio_totals SET
+            item_count = item_count + new.number_of_items - old.number_of_items,
+            total_cost = total_cost + new.total_cost - old.total_cost,
+            total_value = total_value + coalesce(new.total_value, 0) - coalesce(old.total_value, 0),
+            total_return_dollar = total_return_dollar
+                + coalesce(new.total_return_dollar, 0) - coalesce(old.total_return_dollar, 0)
+        WHERE id = 1;
+    END
+    """,
+]
+
+for statement in PORTFOLIO_TOTALS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+class Position(Base):
+    """Purchase lots grouped by market_hash_name, maintained by triggers on inventory."""
+    __tablename__ = "positions"
+
+    market_hash_name = Column(String, primary_key=True)
     item_name = Column(String, nullable=False)
-    cost_per_item = Column(String, nullable=False)
-    number_of_items = Column(String, nullable=False)
-    total_cost = Column(String, nullable=False)
-    current_price = Column(String, nullable=False)
-    total_value = Column(String, nullable=False)
-    total_return_dollar = Column(String, nullable=False)
-    total_return_percent = Column(String, nullable=False)
     item_link = Column(String, nullable=False)
-    
+    lot_count = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Money(), nullable=False, default=0)
+    current_price = Column(Money())  # NULL while none of the lots has been priced
+    total_value = Column(Money(), nullable=False, default=0)
+    total_return_dollar = Column(Money(), nullable=False, default=0)
+    last_priced_at = Column(DateTime)
+
+
+# substr is 1-based, so this is utils.market_hash_name: the link past the 47 character market listing prefix
+POSITION_KEY = "substr({}.item_link, 48)"
+
+
+def _add_to_position(row: str) -> str:
+    key = POSITION_KEY.format(row)
+    return f"""
+        INSERT OR IGNORE INTO positions (market_hash_name, item_name, item_link, lot_count, quantity, total_cost,
+                                         current_price, total_value, total_return_dollar)
+        VALUES ({key}, {row}.item_name, {row}.item_link, 0, 0, 0, {row}.current_price, 0, 0);
+        UPDATE positions SET
+            lot_count = lot_count + 1,
+            quantity = quantity + {row}.number_of_items,
+            total_cost = total_cost + {row}.total_cost,
+            total_value = total_value + coalesce({row}.total_value, 0),
+            total_return_dollar = total_return_dollar + coalesce({row}.total_return_dollar, 0),
+            current_price = coalesce({row}.current_price, current_price),
+            last_priced_at = max(coalesce(last_priced_at, {row}.last_priced_at),
+                                 coalesce({row}.last_priced_at, last_priced_at))
+        WHERE market_hash_name = {key};"""
+
+
+def _remove_from_position(row: str) -> str:
+    key = POSITION_KEY.format(row)
+    return f"""
+        UPDATE positions SET
+            lot_count = lot_count - 1,
+            quantity = quantity - {row}.number_of_items,
+            total_cost = total_cost - {row}.total_cost,
+            total_value = total_value - coalesce({row}.total_value, 0),
+            total_return_dollar = total_return_dollar - coalesce({row}.total_return_dollar, 0)
+        WHERE market_hash_name = {key};
+        DELETE FROM positions WHERE market_hash_name = {key} AND lot_count <= 0;"""
+
+
+POSITIONS_DDL = [
+    # Rebuilt on every startup, like portfolio_totals. The price shown is the one of the most recently priced lot.
+    "DELETE FROM positions",
+    f"""
+    INSERT INTO positions (market_hash_name, item_name, item_link, lot_count, quantity, total_cost,
+                           current_price, total_value, total_return_dollar, last_priced_at)
+    SELECT {POSITION_KEY.format("inventory")}, item_name, item_link, COUNT(*), SUM(number_of_items), SUM(total_cost),
+           current_price, COALESCE(SUM(total_value), 0), COALESCE(SUM(total_return_dollar), 0), MAX(last_priced_at)
+    FROM inventory
+    GROUP BY {POSITION_KEY.format("inventory")}
+    """,
+    "DROP TRIGGER IF EXISTS positions_insert",
+    f"""
+    CREATE TRIGGER positions_insert AFTER INSERT ON inventory BEGIN{_add_to_position("new")}
+    END
+    """,
+    "DROP TRIGGER IF EXISTS positions_delete",
+    f"""
+    CREATE TRIGGER positions_delete AFTER DELETE ON inventory BEGIN{_remove_from_position("old")}
+    END
+    """,
+    # A repriced or edited lot stays in its position, so the common case is a single update of the difference.
+    # Stamping last_priced_at alone does not fire it; refresh.apply_prices stamps positions once per link instead.
+    "DROP TRIGGER IF EXISTS positions_update",
+    f"""
+    CREATE TRIGGER positions_update
+    AFTER UPDATE OF item_name, number_of_items, total_cost, current_price, total_value, total_return_dollar,
+                    item_link ON inventory
+    WHEN {POSITION_KEY.format("new")} = {POSITION_KEY.format("old")} BEGIN
+        UPDATE positions SET
+            quantity = quantity + new.number_of_items - old.number_of_items,
+            total_cost = total_cost + new.total_cost - old.total_cost,
+            total_value = total_value + coalesce(new.total_value, 0) - coalesce(old.total_value, 0),
+            total_return_dollar = total_return_dollar
+                + coalesce(new.total_return_dollar, 0) - coalesce(old.total_return_dollar, 0),
+            item_name = new.item_name,
+            current_price = coalesce(new.current_price, current_price),
+            last_priced_at = max(coalesce(last_priced_at, new.last_priced_at),
+                                 coalesce(new.last_priced_at, last_priced_at))
+        WHERE market_hash_name = {POSITION_KEY.format("new")};
+    END
+    """,
+    "DROP TRIGGER IF EXISTS positions_move",
+    f"""
+    CREATE TRIGGER positions_move
+    AFTER UPDATE OF item_link ON inventory
+    WHEN {POSITION_KEY.format("new")} != {POSITION_KEY.format("old")} BEGIN{_remove_from_position("old")}{_add_to_position("new")}
+    END
+    """,
+]
+
+for statement in POSITIONS_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+class PriceQuote(Base):
+    """Latest upstream quote per market item, shared by every worker process."""
+    __tablename__ = "price_quotes"
+
+    market_hash_name = Column(String, primary_key=True)
+    price = Column(Float, nullable=False)
+    fetched_at = Column(Float, nullable=False)  # unix seconds
+
+
+class Lease(Base):
+    """A named lock held by one worker until it is released or expires_at (unix seconds) passes."""
+    __tablename__ = "leases"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(Float, nullable=False)
+
+
+class DataVersion(Base):
+    """Counters bumped by triggers whenever the data they are named after changes."""
+    __tablename__ = "data_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class SharedResult(Base):
+    """A computed result shared between workers; it is only valid while version matches the data it came from."""
+    __tablename__ = "shared_results"
+
+    key = Column(String, primary_key=True)
+    version = Column(String, nullable=False)
+    value = Column(LargeBinary, nullable=False)
+
+
+class RefreshJobRecord(Base):
+    """Price refresh jobs, so any worker can report on a job another one is running."""
+    __tablename__ = "refresh_jobs"
+
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)
+    total_items = Column(Integer, nullable=False, default=0)
+    progress = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(String)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    heartbeat_at = Column(Float)  # unix seconds of the owning worker's last update
+
+
+class SharedEvent(Base):
+    """Events published by one worker, relayed from here to the /events subscribers of the others."""
+    __tablename__ = "shared_events"
+    # AUTOINCREMENT, so ids are never handed out again after old events are pruned
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    origin = Column(String, nullable=False)  # the publishing worker, which has delivered it already
+    payload = Column(LargeBinary, nullable=False)  # the event as JSON
+    created_at = Column(Float, nullable=False, index=True)  # unix seconds
+
+
+DATA_VERSION_DDL = [
+    "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('inventory', 0)",
+    "DROP TRIGGER IF EXISTS data_versions_insert",
+    """
+    CREATE TRIGGER data_versions_insert AFTER INSERT ON inventory BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'inventory';
+    END
+    """,
+    "DROP TRIGGER IF EXISTS data_versions_delete",
+    """
+    CREATE TRIGGER data_versions_delete AFTER DELETE ON inventory BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'inventory';
+    END
+    """,
+    "DROP TRIGGER IF EXISTS data_versions_update",
+    """
+    CREATE TRIGGER data_versions_update
+    AFTER UPDATE OF purchase_date, item_name, cost_per_item, number_of_items, current_price, item_link ON inventory BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'inventory';
+    END
+    """,
+]
+
+for statement in DATA_VERSION_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+def _wear_sql(name: str) -> str:
+    cases = " ".join(f"WHEN instr({name}, '({wear})') > 0 THEN '{wear}'" for wear in WEARS)
+    return f"CASE {cases} ELSE '' END"
+
+
+def _flags_sql(name: str) -> str:
+    # Every row carries either stattrak or nostattrak so both filters are positive MATCH terms
+    return (f"(CASE WHEN instr({name}, 'StatTrak') > 0 THEN 'stattrak' ELSE 'nostattrak' END"
+            f" || CASE WHEN substr({name}, 1, 8) = 'Souvenir' THEN ' souvenir' ELSE '' END)")
+
+
+def _fts_values(row: str) -> str:
+    name = f"{row}.item_name"
+    return f"{row}.item_number, {name}, {_wear_sql(name)}, {_flags_sql(name)}"
+
+
+INVENTORY_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS inventory_fts USING fts5(
+        item_name, wear, flags, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    # Backfill rows written while the index did not exist and drop entries for rows that are gone
+    "DELETE FROM inventory_fts WHERE rowid NOT IN (SELECT item_number FROM inventory)",
+    f"""
+    INSERT INTO inventory_fts (rowid, item_name, wear, flags)
+    SELECT {_fts_values("inventory")} FROM inventory
+    WHERE item_number NOT IN (SELECT rowid FROM inventory_fts)
+    """,
+    "DROP TRIGGER IF EXISTS inventory_fts_insert",
+    f"""
+    CREATE TRIGGER inventory_fts_insert AFTER INSERT ON inventory BEGIN
+        INSERT INTO inventory_fts (rowid, item_name, wear, flags) VALUES ({_fts_values("new")});
+    END
+    """,
+    "DROP TRIGGER IF EXISTS inventory_fts_delete",
+    """
+    CREATE TRIGGER inventory_fts_delete AFTER DELETE ON inventory BEGIN
+        DELETE FROM inventory_fts WHERE rowid = old.item_number;
+    END
+    """,
+    "DROP TRIGGER IF EXISTS inventory_fts_update",
+    f"""
+    CREATE TRIGGER inventory_fts_update AFTER UPDATE OF item_name ON inventory BEGIN
+        DELETE FROM inventory_fts WHERE rowid = old.item_number;
+        INSERT INTO inventory_fts (rowid, item_name, wear, flags) VALUES ({_fts_values("new")});
+    END
+    """,
+]
+
+for statement in INVENTORY_SEARCH_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+from config import settings
+from database import engine
+from models import PriceQuote
+from price_provider import PriceFetchError, fetch_price, fetch_price_async
+from shared_state import acquire_lease, new_owner, release_lease, upsert
+from utils import market_hash_name
+
+logger = logging.getLogger(__name__)
+
+
+class SharedQuote(NamedTuple):
+    price: float
+    age: float  # seconds since the quote was fetched upstream
+    fetched: bool  # whether this caller was the one that fetched it
+
+
+class SharedQuoteStore:
+    """Quotes kept in the database, so every worker process (and the next start) can reuse them. A worker
+    that misses takes a lease on the key before going upstream; the others wait for its quote to appear
+    instead of fetching the same price themselves, or take over if the lease expires first."""
+
+    def __init__(self, ttl: float, lease_seconds: float, poll_interval: float = 0.05):
+        self.ttl = ttl
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.hits = 0
+        self.waits = 0
+
+    def lookup(self, key: str) -> Optional[SharedQuote]:
+        now = time.time()
+        query = select(PriceQuote.price, PriceQuote.fetched_at).where(PriceQuote.market_hash_name == key,
+                                                                      PriceQuote.fetched_at >= now - self.ttl)
+        with engine.connect() as conn:
+            row = conn.execute(query).first()
+        return SharedQuote(row.price, max(now - row.fetched_at, 0.0), False) if row is not None else None
+
+    def save(self, key: str, price: float, owner: str):
+        # The quote and the release of its lease commit together, so waiting workers find the quote
+        statement = upsert(PriceQuote).values(market_hash_name=key, price=price, fetched_at=time.time())
+        statement = statement.on_conflict_do_update(
+            index_elements=[PriceQuote.market_hash_name],
+            set_={"price": statement.excluded.price, "fetched_at": statement.excluded.fetched_at},
+        )
+        with engine.begin() as conn:
+            conn.execute(statement)
+            release_lease(f"quote:{key}", owner, conn)
+
+    def _poll(self, key: str, owner: str) -> Tuple[Optional[SharedQuote], bool]:
+        # (quote, False) when another worker has fetched it; (None, True) once this caller holds the lease
+        quote = self.lookup(key)
+        if quote is not None:
+            self.hits += 1
+            return quote, False
+        return None, acquire_lease(f"quote:{key}", owner, self.lease_seconds)
+
+    def load(self, key: str, loader: Callable[[], float]) -> SharedQuote:
+        owner = new_owner()
+        waited = False
+        while True:
+            quote, leased = self._poll(key, owner)
+            if quote is not None:
+                return quote
+            if leased:
+                break
+            if not waited:
+                self.waits += 1
+                waited = True
+            time.sleep(self.poll_interval)
+
+        try:
+            price = loader()
+        except BaseException:
+            release_lease(f"quote:{key}", owner)
+            raise
+        self.save(key, price, owner)
+        return SharedQuote(price, 0.0, True)
+
+    async def load_async(self, key: str, loader: Callable[[], Awaitable[float]]) -> SharedQuote:
+        owner = new_owner()
+        waited = False
+        while True:
+            quote, leased = await asyncio.to_thread(self._poll, key, owner)
+            if quote is not None:
+                return quote
+            if leased:
+                break
+            if not waited:
+                self.waits += 1
+                waited = True
+            await asyncio.sleep(self.poll_interval)
+
+        try:
+            price = await loader()
+        except BaseException:
+            await asyncio.to_thread(release_lease, f"quote:{key}", owner)
+            raise
+        await asyncio.to_thread(self.save, key, price, owner)
+        return SharedQuote(price, 0.0, True)
+
+
+class PriceCache:
+    """LRU cache of price quotes with a TTL. Concurrent misses for one key share a single upstream call.
+    With a SharedQuoteStore, misses are looked up there next and shared with the other worker processes."""
+
+    def __init__(self, ttl: float, maxsize: int, store: Optional[SharedQuoteStore] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str, float], None]] = []
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, key: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        price, fetched_at = entry
+        if time.monotonic() - fetched_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return price
+
+    def _claim(self, key: str) -> Tuple[Optional[float], Optional[Future], bool]:
+        # (cached price, None, False) on a hit; otherwise the in-flight future and whether we lead it
+        with self._lock:
+            price = self._lookup(key)
+            if price is not None:
+                self.hits += 1
+                return price, None, False
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                self.misses += 1
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+            return None, future, leader
+
+    @staticmethod
+    def _fail(future: Future, exc: BaseException):
+        # Followers only expect lookup errors; a leader that is cancelled or interrupted must not hand them
+        # a CancelledError or KeyboardInterrupt that escapes their `except Exception`
+        if not isinstance(exc, Exception):
+            exc = PriceFetchError(f"Price lookup was interrupted ({type(exc).__name__})")
+        future.set_exception(exc)
+
+    def get(self, key: str, loader: Callable[[], float]) -> float:
+        price, future, leader = self._claim(key)
+        if future is None:
+            return price
+        if not leader:
+            return future.result()
+
+        try:
+            quote = self.store.load(key, loader) if self.store is not None else SharedQuote(loader(), 0.0, True)
+        except BaseException as exc:
+            self._fail(future, exc)
+            raise
+        else:
+            price = quote.price
+            self.put(key, price, quote.age)
+            future.set_result(price)
+            if quote.fetched:
+                self._notify(key, price)
+            return price
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def get_async(self, key: str, loader: Callable[[], Awaitable[float]]) -> float:
+        # Shares hits and in-flight lookups with get(), so threads and coroutines coalesce on each other
+        price, future, leader = self._claim(key)
+        if future is None:
+            return price
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            if self.store is not None:
+                quote = await self.store.load_async(key, loader)
+            else:
+                quote = SharedQuote(await loader(), 0.0, True)
+        except BaseException as exc:
+            self._fail(future, exc)
+            raise
+        else:
+            price = quote.price
+            self.put(key, price, quote.age)
+            future.set_result(price)
+            if quote.fetched:
+                # Listeners write to the database synchronously, so they run off the event loop
+                await asyncio.to_thread(self._notify, key, price)
+            return price
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def add_listener(self, listener: Callable[[str, float], None]):
+        # Listeners see every quote fetched upstream (not cache or shared store hits), e.g. to record price history
+        self._listeners.append(listener)
+
+    def _notify(self, key: str, price: float):
+        for listener in self._listeners:
+            try:
+                listener(key, price)
+            except Exception:
+                logger.exception("Price listener failed for %s", key)
+
+    def put(self, key: str, price: float, age: float = 0.0):
+        # age backdates quotes another worker fetched, so they expire on the same schedule everywhere
+        with self._lock:
+            self._entries[key] = (price, time.monotonic() - age)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                "shared_hits": self.store.hits if self.store is not None else None,
+                "shared_waits": self.store.waits if self.store is not None else None,
+            }
+
+
+price_cache = PriceCache(
+    settings.price_cache_ttl, settings.price_cache_size,
+    SharedQuoteStore(settings.price_cache_ttl, settings.price_quote_lease) if settings.shared_cache_enabled else None,
+)
+
+
+def cached_price(item_link: str, loader: Callable[[str], float] = fetch_price) -> float:
+    # Raises PriceFetchError like the loader does; failed lookups are never cached
+    return price_cache.get(market_hash_name(item_link), lambda: loader(item_link))
+
+
+async def cached_price_async(item_link: str,
+                             loader: Callable[[str], Awaitable[float]] = fetch_price_async) -> float:
+    return await price_cache.get_async(market_hash_name(item_link), lambda: loader(item_link))
@@ -0,0 +1,153 @@
+import calendar
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import DailyPrice, HourlyPrice, MarketItem, PriceHistory
+
+DAY = 86400
+ROLLUPS = [(HourlyPrice, 3600), (DailyPrice, DAY)]
+RESOLUTIONS = {"raw": PriceHistory, "hour": HourlyPrice, "day": DailyPrice}
+
+
+def to_timestamp(value: datetime) -> int:
+    # Naive datetimes are taken to be UTC
+    return calendar.timegm(value.utctimetuple())
+
+
+def _upsert(db: Session, model):
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def _greatest(db: Session):
+    # SQLite's multi-argument max()/min() are GREATEST()/LEAST() elsewhere
+    return (func.greatest, func.least) if db.bind.dialect.name == "postgresql" else (func.max, func.min)
+
+
+def market_item_id(db: Session, market_hash_name: str) -> int:
+    item_id = db.query(MarketItem.id).filter(MarketItem.market_hash_name == market_hash_name).scalar()
+    if item_id is None:
+        db.execute(_upsert(db, MarketItem).values(market_hash_name=market_hash_name).on_conflict_do_nothing())
+        item_id = db.query(MarketItem.id).filter(MarketItem.market_hash_name == market_hash_name).scalar()
+    return item_id
+
+
+def record_price(db: Session, market_hash_name: str, price: float, observed_at: Optional[int] = None):
+    # Failed lookups raise before getting here; a missing or non-positive price is still not an observation
+    if price is None or price <= 0:
+        return
+
+    observed_at = int(observed_at if observed_at is not None else time.time())
+    cents = round(price * 100)
+    item_id = market_item_id(db, market_hash_name)
+
+    raw = _upsert(db, PriceHistory).values(market_item_id=item_id, observed_at=observed_at, price_cents=cents)
+    db.execute(raw.on_conflict_do_update(
+        index_elements=[PriceHistory.market_item_id, PriceHistory.observed_at],
+        set_={"price_cents": cents},
+    ))
+
+    greatest, least = _greatest(db)
+    for model, width in ROLLUPS:
+        bucket = _upsert(db, model).values(
+            market_item_id=item_id, bucket_start=observed_at - observed_at % width,
+            open_cents=cents, high_cents=cents, low_cents=cents, close_cents=cents, samples=1,
+        )
+        db.execute(bucket.on_conflict_do_update(
+            index_elements=[model.market_item_id, model.bucket_start],
+            set_={
+                "high_cents": greatest(model.high_cents, bucket.excluded.high_cents),
+                "low_cents": least(model.low_cents, bucket.excluded.low_cents),
+                "close_cents": bucket.excluded.close_cents,
+                "samples": model.samples + 1,
+            },
+        ))
+
+
+def prune_price_history(db: Session, now: Optional[int] = None):
+    now = int(now if now is not None else time.time())
+    raw_cutoff = now - settings.history_raw_retention_days * DAY
+    hourly_cutoff = now - settings.history_hourly_retention_days * DAY
+    db.query(PriceHistory).filter(PriceHistory.observed_at < raw_cutoff).delete(synchronize_session=False)
+    db.query(HourlyPrice).filter(HourlyPrice.bucket_start < hourly_cutoff).delete(synchronize_session=False)
+
+
+last_pruned = 0.0
+prune_lock = threading.Lock()
+
+
+def record_fetched_price(market_hash_name: str, price: float):
+    """PriceCache listener: store every upstream quote and prune old rows at most once an hour."""
+    global last_pruned
+    db = SessionLocal()
+    try:
+        record_price(db, market_hash_name, price)
+        with prune_lock:
+            prune_due = time.time() - last_pruned > 3600
+            if prune_due:
+                last_pruned = time.time()
+        if prune_due:
+            prune_price_history(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def pick_resolution(start: int, end: int, now: Optional[int] = None) -> str:
+    # Use the finest tier that both still holds data for the start of the range and keeps the point count small
+    now = int(now if now is not None else time.time())
+    span = end - start
+    if span <= 2 * DAY and start >= now - settings.history_raw_retention_days * DAY:
+        return "raw"
+    if span <= 90 * DAY and start >= now - settings.history_hourly_retention_days * DAY:
+        return "hour"
+    return "day"
+
+
+def get_price_history(db: Session, market_hash_name: str, start: int, end: int,
+                      resolution: str = "auto") -> Tuple[str, List[dict]]:
+    if resolution == "auto":
+        resolution = pick_resolution(start, end)
+
+    item_id = db.query(MarketItem.id).filter(MarketItem.market_hash_name == market_hash_name).scalar()
+    if item_id is None:
+        return resolution, []
+
+    model = RESOLUTIONS[resolution]
+    if model is PriceHistory:
+        rows = (
+            db.query(PriceHistory.observed_at, PriceHistory.price_cents)
+            .filter(PriceHistory.market_item_id == item_id, PriceHistory.observed_at.between(start, end))
+            .order_by(PriceHistory.observed_at)
+        )
+        points = [
+            {"time": datetime.fromtimestamp(ts, tz=timezone.utc), "open": cents / 100, "high": cents / 100,
+             "low": cents / 100, "close": cents / 100, "samples": 1}
+            for ts, cents in rows
+        ]
+    else:
+        # Include the bucket the range starts in
+        width = dict(ROLLUPS)[model]
+        rows = (
+            db.query(model)
+            .filter(model.market_item_id == item_id, model.bucket_start.between(start - start % width, end))
+            .order_by(model.bucket_start)
+        )
+        points = [
+            {"time": datetime.fromtimestamp(row.bucket_start, tz=timezone.utc), "open": row.open_cents / 100,
+             "high": row.high_cents / 100, "low": row.low_cents / 100, "close": row.close_cents / 100,
+             "samples": row.samples}
+            for row in rows
+        ]
+    return resolution, points
@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import settings
+from metrics import price_fetch_duration, price_fetches
+from utils import name_finder
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class PriceFetchError(Exception):
+    """A price could not be fetched. Callers must not treat this as a price of 0."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PriceRateLimited(PriceFetchError):
+    pass
+
+
+class PriceUnavailable(PriceFetchError):
+    """The provider timed out, could not be reached or answered with a server error."""
+
+
+class PriceTimeout(PriceUnavailable):
+    pass
+
+
+class PriceNotFound(PriceFetchError):
+    pass
+
+
+class CircuitOpenError(PriceFetchError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after a run of consecutive failures and rejects calls until reset_timeout has passed.
+    Then a single trial call is let through; its outcome closes or re-opens the circuit."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self.trial_running:
+                raise CircuitOpenError("Price provider circuit is open", retry_after=max(remaining, 0))
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Price provider circuit opened after %d failures", self.failures)
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def release_trial(self):
+        # For calls that ended without an answer either way (a bug, or cancellation): the next call gets the trial
+        with self.lock:
+            self.trial_running = False
+
+
+class PriceProvider:
+    """Source of current market prices, keyed by the item's Steam market link."""
+    name = "provider"
+
+    def fetch(self, item_link: str) -> float:
+        raise NotImplementedError
+
+    async def fetch_async(self, item_link: str) -> float:
+        # Providers without a native async client run the blocking fetch on a worker thread
+        return await asyncio.to_thread(self.fetch, item_link)
+
+    async def aclose(self):
+        pass
+
+    def status(self) -> dict:
+        return {"name": self.name}
+
+
+def parse_price(text: str) -> float:
+    return float(text.replace('$', '').replace(',', ''))
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def fetch_outcome(exc: Optional[BaseException]) -> str:
+    if exc is None:
+        return "ok"
+    for error, outcome in ((PriceRateLimited, "rate_limited"), (PriceTimeout, "timeout"),
+                           (PriceNotFound, "not_found"), (PriceFetchError, "error")):
+        if isinstance(exc, error):
+            return outcome
+    return "error"
+
+
+def record_fetch(started: float, exc: Optional[BaseException] = None):
+    outcome = fetch_outcome(exc)
+    price_fetches.inc(outcome=outcome)
+    price_fetch_duration.observe(time.perf_counter() - started, outcome=outcome)
+
+
+class SteamPriceProvider(PriceProvider):
+    """Steam's priceoverview endpoint (or anything speaking its format, like fake_price_server.py) over
+    pooled keep-alive connections. Transient failures are retried with jittered backoff; rate limits are
+    left to the caller, which owns the request budget."""
+    name = "steam"
+
+    def __init__(self, base_url: str, connect_timeout: float, read_timeout: float, retries: int,
+                 backoff: float, pool_size: int, breaker: CircuitBreaker):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # One httpx client per event loop: its connections belong to the loop that opened them
+        self._async_clients: Dict[asyncio.AbstractEventLoop, "httpx.AsyncClient"] = {}
+
+    @classmethod
+    def from_settings(cls) -> "SteamPriceProvider":
+        return cls(
+            settings.price_provider_url,
+            settings.price_provider_connect_timeout,
+            settings.price_provider_read_timeout,
+            settings.price_provider_retries,
+            settings.price_provider_backoff,
+            settings.price_provider_pool_size,
+            CircuitBreaker(settings.price_breaker_threshold, settings.price_breaker_reset),
+        )
+
+    def fetch(self, item_link: str) -> float:
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            try:
+                price = self._timed_request(item_link)
+            except PriceUnavailable:
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+            except PriceFetchError:
+                # The provider answered, so it is up even if it had no price for us
+                self.breaker.record_success()
+                raise
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            else:
+                self.breaker.record_success()
+                return price
+
+    async def fetch_async(self, item_link: str) -> float:
+        # Same retry and circuit breaker policy as fetch, without holding a thread while waiting
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            try:
+                price = await self._timed_request_async(item_link)
+            except PriceUnavailable:
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt))
+            except PriceFetchError:
+                self.breaker.record_success()
+                raise
+            except BaseException:
+                # Including CancelledError, when the client goes away or a caller's timeout fires mid-trial
+                self.breaker.release_trial()
+                raise
+            else:
+                self.breaker.record_success()
+                return price
+
+    def _retry_delay(self, attempt: int) -> float:
+        # Full jitter keeps a pool of workers from retrying in lockstep
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    def _params(self, item_link: str) -> dict:
+        return {"appid": 730, "currency": 1, "market_hash_name": name_finder(item_link)}
+
+    def _timed_request(self, item_link: str) -> float:
+        started = time.perf_counter()
+        try:
+            price = self._request(item_link)
+        except BaseException as exc:
+            record_fetch(started, exc)
+            raise
+        record_fetch(started)
+        return price
+
+    async def _timed_request_async(self, item_link: str) -> float:
+        started = time.perf_counter()
+        try:
+            price = await self._request_async(item_link)
+        except BaseException as exc:
+            record_fetch(started, exc)
+            raise
+        record_fetch(started)
+        return price
+
+    def _request(self, item_link: str) -> float:
+        try:
+            response = self.session.get(self.base_url, params=self._params(item_link), timeout=self.timeout)
+        except requests.Timeout as exc:
+            raise PriceTimeout(f"{type(exc).__name__}: {exc}") from exc
+        except requests.RequestException as exc:
+            raise PriceUnavailable(f"{type(exc).__name__}: {exc}") from exc
+        return self._parse_response(response, item_link)
+
+    def _async_client(self) -> "httpx.AsyncClient":
+        # httpx is imported on the first async fetch; it and its transports take a good part of startup otherwise
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            # Clients of loops that have since closed cannot be reused or cleanly closed, only dropped
+            self._async_clients = {other: c for other, c in self._async_clients.items() if not other.is_closed()}
+            client = self._async_clients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+        return client
+
+    async def _request_async(self, item_link: str) -> float:
+        import httpx
+
+        try:
+            response = await self._async_client().get(self.base_url, params=self._params(item_link))
+        except httpx.TimeoutException as exc:
+            raise PriceTimeout(f"{type(exc).__name__}: {exc}") from exc
+        except httpx.HTTPError as exc:
+            raise PriceUnavailable(f"{type(exc).__name__}: {exc}") from exc
+        return self._parse_response(response, item_link)
+
+    async def aclose(self):
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def _parse_response(self, response, item_link: str) -> float:
+        # requests and httpx responses look alike for everything used here
+        if response.status_code == 429:
+            raise PriceRateLimited("Rate limited by price provider", retry_after_seconds(response))
+        if response.status_code >= 500:
+            raise PriceUnavailable(f"Price provider returned {response.status_code}", retry_after_seconds(response))
+        if response.status_code != 200:
+            raise PriceNotFound(f"Price provider returned {response.status_code}")
+
+        try:
+            data = response.json()
+            if not isinstance(data, dict):
+                raise PriceUnavailable(f"Unexpected price response: {data!r:.100}")
+            lowest_price = data.get("lowest_price")
+            if not data.get("success") or lowest_price is None:
+                raise PriceNotFound(f"No price listed for {name_finder(item_link)}")
+            return parse_price(lowest_price)
+        except ValueError as exc:
+            raise PriceUnavailable(f"Unreadable price response: {exc}") from exc
+
+    def status(self) -> dict:
+        return {"name": self.name, "base_url": self.base_url, "circuit": self.breaker.state,
+                "consecutive_failures": self.breaker.failures}
+
+
+price_provider: PriceProvider = SteamPriceProvider.from_settings()
+
+
+def fetch_price(item_link: str) -> float:
+    # Looked up at call time so another PriceProvider can be installed in price_provider
+    return price_provider.fetch(item_link)
+
+
+async def fetch_price_async(item_link: str) -> float:
+    return await price_provider.fetch_async(item_link)
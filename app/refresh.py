@@ -0,0 +1,327 @@
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Float, bindparam, func, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal, engine
+from events import event_bus, item_event
+from metrics import refresh_duration, refresh_items, refresh_jobs, refresh_throughput
+from models import Inventory, Position, RefreshJobRecord
+from services import calculated_field_values, chunked, queue_item_events
+from price_cache import cached_price
+from price_provider import PriceRateLimited, PriceUnavailable, fetch_price
+from shared_state import acquire_lease, lease_holder, release_lease, upsert
+from utils import market_hash_name
+
+REFRESH_LEASE = "price-refresh"
+EVENT_ROW_LIMIT = 1000  # past this many repriced rows, subscribers are told to reload instead of sent each one
+CHECKPOINT_INTERVAL = 1.0  # seconds between saves of a running job's progress
+HEARTBEATS_PER_LEASE = 6  # lease renewals per refresh_lease, whether or not any item has finished
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate backs off on throttling and recovers on success."""
+
+    def __init__(self, rate: float, capacity: int, min_rate: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_throttle(self):
+        # Multiplicative decrease, and drop any burst we had saved up
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def on_success(self):
+        # Additive increase back towards the configured rate
+        with self.lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def default_limiter() -> TokenBucket:
+    return TokenBucket(settings.refresh_rate, settings.refresh_burst, settings.refresh_min_rate)
+
+
+def fetch_with_backoff(item_link: str, limiter: TokenBucket) -> float:
+    delay = 1.0
+    for attempt in range(settings.refresh_max_retries + 1):
+        limiter.acquire()
+        try:
+            price = fetch_price(item_link)
+        except (PriceRateLimited, PriceUnavailable) as exc:
+            # Not found and open-circuit errors are final; an open circuit fails the rest of the run fast
+            if attempt == settings.refresh_max_retries:
+                raise
+            limiter.on_throttle()
+            time.sleep(min(settings.refresh_backoff_max, exc.retry_after or delay))
+            delay *= 2
+        else:
+            limiter.on_success()
+            return price
+
+
+def fetch_prices(item_links: Iterable[str], limiter: Optional[TokenBucket] = None) -> Iterator[Tuple[str, Optional[float]]]:
+    """Fetch prices concurrently, yielding (item_link, price) as they complete. Failed lookups yield None."""
+    limiter = limiter or default_limiter()
+    unique_links = list(dict.fromkeys(item_links))
+    with ThreadPoolExecutor(max_workers=settings.refresh_workers) as pool:
+        futures = {
+            pool.submit(cached_price, link, lambda item_link: fetch_with_backoff(item_link, limiter)): link
+            for link in unique_links
+        }
+        for future in as_completed(futures):
+            try:
+                price = future.result()
+            except Exception:
+                price = None
+            yield futures[future], price
+
+
+class RefreshJob:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "pending"
+        self.total_items = 0
+        self.progress = 0
+        self.failed = 0
+        self.error: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.saved_at = 0.0
+        self.save_lock = threading.Lock()
+        self.heartbeat_stop = threading.Event()
+        self.heartbeat_thread: Optional[threading.Thread] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("pending", "running")
+
+    @classmethod
+    def from_record(cls, record: RefreshJobRecord) -> "RefreshJob":
+        job = cls()
+        for field in ("id", "status", "total_items", "progress", "failed", "error", "started_at", "finished_at"):
+            setattr(job, field, getattr(record, field))
+        if job.is_active and (record.heartbeat_at or 0) < time.time() - settings.refresh_lease:
+            # The worker running it exited or hung; its lease has run out and another refresh may start
+            job.status = "failed"
+            job.error = "The worker running this refresh stopped responding"
+        return job
+
+    def save(self):
+        # Other workers read the job from here; the owning worker also renews its lease on every save
+        with self.save_lock:
+            self.saved_at = time.monotonic()
+            values = {"id": self.id, "status": self.status, "total_items": self.total_items,
+                      "progress": self.progress, "failed": self.failed, "error": self.error,
+                      "started_at": self.started_at, "finished_at": self.finished_at, "heartbeat_at": time.time()}
+            statement = upsert(RefreshJobRecord).values(**values)
+            statement = statement.on_conflict_do_update(index_elements=[RefreshJobRecord.id], set_=values)
+            with engine.begin() as conn:
+                conn.execute(statement)
+            if self.is_active:
+                acquire_lease(REFRESH_LEASE, self.id, settings.refresh_lease)
+
+    def checkpoint(self):
+        if time.monotonic() - self.saved_at >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def start_heartbeat(self):
+        # Every fetch may be backing off on rate limits at once, so the lease is renewed on a timer, not on progress
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat, name=f"refresh-heartbeat-{self.id[:8]}",
+                                                 daemon=True)
+        self.heartbeat_thread.start()
+
+    def _heartbeat(self):
+        while not self.heartbeat_stop.wait(settings.refresh_lease / HEARTBEATS_PER_LEASE):
+            self.save()
+
+    def stop_heartbeat(self):
+        # Joined before the final save, so a late heartbeat cannot write the job back as running
+        self.heartbeat_stop.set()
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "total_items": self.total_items,
+            "failed": self.failed,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def apply_prices(db: Session, prices: List[Tuple[str, float]]):
+    """Reprice every lot of each item_link with one executemany UPDATE; the totals are computed by the database.
+    Lots whose price is unchanged only have last_priced_at set, which leaves their indexed totals alone;
+    unpriced lots (NULL) always count as changed.
+    The positions triggers keep the grouped totals in step; last_priced_at is stamped here, once per link."""
+    if not prices:
+        return
+    inventory = Inventory.__table__
+    priced_at = datetime.utcnow()
+    links = [link for link, _ in prices]
+    params = [{"link": link, "price": price} for link, price in prices]
+    new_price = bindparam("price", type_=Float)
+    same_link = inventory.c.item_link == bindparam("link")
+    changed = db.execute(
+        update(inventory)
+        .where(same_link, inventory.c.current_price.is_distinct_from(new_price))
+        .values(current_price=new_price, last_priced_at=priced_at, **calculated_field_values(new_price)),
+        params,
+    )
+    unchanged = db.execute(
+        update(inventory).where(same_link, inventory.c.current_price == new_price).values(last_priced_at=priced_at),
+        params,
+    )
+    repriced = changed.rowcount + unchanged.rowcount
+    positions = Position.__table__
+    db.execute(
+        update(positions)
+        .where(positions.c.market_hash_name == func.substr(bindparam("link"), 48))
+        .values(last_priced_at=priced_at),
+        [{"link": link} for link in links],
+    )
+
+    if repriced > EVENT_ROW_LIMIT:
+        events = [{"type": "resync"}]
+    else:
+        events = []
+        for chunk in chunked(links):
+            items = db.query(Inventory).filter(Inventory.item_link.in_(chunk)).populate_existing()
+            events.extend(item_event("item.updated", item) for item in items)
+    queue_item_events(db, events)
+    db.commit()
+
+
+def run_refresh(job: RefreshJob):
+    db = SessionLocal()
+    try:
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        job.save()
+        job.start_heartbeat()
+
+        # Each position (every lot of one market_hash_name) needs one upstream lookup, whichever link its lots use
+        lots_by_name: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for item_link, lot_count in db.query(Inventory.item_link, func.count()).group_by(Inventory.item_link):
+            lots_by_name[market_hash_name(item_link)][item_link] = lot_count
+        job.total_items = sum(sum(links.values()) for links in lots_by_name.values())
+
+        batch = []
+        for item_link, price in fetch_prices(next(iter(links)) for links in lots_by_name.values()):
+            links = lots_by_name[market_hash_name(item_link)]
+            if price is None:
+                job.failed += sum(links.values())
+            else:
+                batch.extend((link, price) for link in links)
+                if len(batch) >= settings.refresh_batch_size:
+                    apply_prices(db, batch)
+                    batch.clear()
+            job.progress += sum(links.values())
+            publish_progress(job)
+            job.checkpoint()
+        if batch:
+            apply_prices(db, batch)
+
+        job.status = "completed"
+    except Exception as exc:
+        db.rollback()
+        job.status = "failed"
+        job.error = str(exc)
+    finally:
+        job.stop_heartbeat()
+        job.finished_at = datetime.utcnow()
+        db.close()
+        job.save()
+        release_lease(REFRESH_LEASE, job.id)
+        record_job_metrics(job)
+        publish_progress(job)
+
+
+def record_job_metrics(job: RefreshJob):
+    elapsed = (job.finished_at - job.started_at).total_seconds() if job.started_at else 0
+    refresh_jobs.inc(status=job.status)
+    refresh_items.inc(job.progress - job.failed, outcome="updated")
+    refresh_items.inc(job.failed, outcome="failed")
+    refresh_duration.observe(elapsed)
+    if elapsed > 0:
+        refresh_throughput.set(job.progress / elapsed)
+
+
+def publish_progress(job: RefreshJob):
+    event_bus.publish({"type": "refresh.progress", "job": job.to_dict()})
+
+
+jobs: Dict[str, RefreshJob] = {}
+jobs_lock = threading.Lock()
+
+
+def start_refresh() -> RefreshJob:
+    # Only one refresh runs at a time, across all workers; a second request joins the running job
+    with jobs_lock:
+        for job in jobs.values():
+            if job.is_active:
+                return job
+    # jobs_lock is not held while waiting on the lease, so job lookups in this worker carry on meanwhile
+    job = RefreshJob()
+    while not acquire_lease(REFRESH_LEASE, job.id, settings.refresh_lease):
+        running = load_refresh_job(lease_holder(REFRESH_LEASE))
+        if running is not None:
+            return running
+        # The holder has not saved its job yet, or has just released the lease
+        time.sleep(0.05)
+    with jobs_lock:
+        jobs[job.id] = job
+    job.save()
+    threading.Thread(target=run_refresh, args=(job,), daemon=True).start()
+    return job
+
+
+def load_refresh_job(job_id: Optional[str]) -> Optional[RefreshJob]:
+    if job_id is None:
+        return None
+    with SessionLocal() as db:
+        record = db.get(RefreshJobRecord, job_id)
+        return RefreshJob.from_record(record) if record is not None else None
+
+
+def get_refresh_job(job_id: str) -> Optional[RefreshJob]:
+    # Jobs run by this worker are current in memory; the others are as of their last checkpoint
+    return jobs.get(job_id) or load_refresh_job(job_id)
+
+
+def refresh_running() -> bool:
+    return any(job.is_active for job in list(jobs.values())) or lease_holder(REFRESH_LEASE) is not None
@@ -1,16 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import RedirectResponse
+import asyncio
+import io
+import tempfile
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
+from typing import List, Literal, Optional
+from datetime import date, datetime, timedelta
 
-from models import Inventory
-from schemas import NewItem, InventoryResponse, UpdateItem
-from services import create_item, get_item, delete_item_by_id, update_current_prices, update_current_price, update_calculated_fields, get_item_or_404
-from database import get_db
+from schemas import NewItem, InventoryResponse, UpdateItem, ItemChanges, ItemNumbers, PortfolioSummary, PriceHistoryResponse, \
+    PortfolioAnalytics, PositionResponse
+from services import create_item, create_items, delete_item_by_id, update_current_price, update_item, get_item_or_404, get_portfolio_summary, \
+    get_items_page, select_item_columns, serialize_row, stream_ndjson, search_inventory, Ranges, update_items, delete_items, \
+    price_or_502_async, get_positions
+from refresh import start_refresh, get_refresh_job, fetch_prices
+from price_cache import price_cache
+import price_provider
+from price_history import get_price_history, to_timestamp
+from utils import market_hash_name
+from database import get_db, get_async_db
+from events import event_bus
+from metrics import registry
+from import_export import EXPORT_MEDIA_TYPES, import_csv, require_arrow, stream_export
 
 router = APIRouter()
 
+SortField = Literal["item_number", "purchase_date", "current_price", "total_value", "total_return_percent"]
+SortOrder = Literal["asc", "desc"]
+PositionSortField = Literal["market_hash_name", "quantity", "average_cost", "total_cost", "current_price", "total_value",
+                            "total_return_percent"]
+
+
+def item_ranges(
+    min_purchase_date: Optional[date] = None,
+    max_purchase_date: Optional[date] = None,
+    min_current_price: Optional[float] = None,
+    max_current_price: Optional[float] = None,
+    min_total_value: Optional[float] = None,
+    max_total_value: Optional[float] = None,
+    min_total_return_percent: Optional[float] = None,
+    max_total_return_percent: Optional[float] = None,
+) -> Ranges:
+    ranges = {
+        "purchase_date": (min_purchase_date, max_purchase_date),
+        "current_price": (min_current_price, max_current_price),
+        "total_value": (min_total_value, max_total_value),
+        "total_return_percent": (min_total_return_percent, max_total_return_percent),
+    }
+    return {field: bounds for field, bounds in ranges.items() if bounds != (None, None)}
+
 @router.get("/")
 def read_root():
     # Redirect to the desired route or return the main template
@@ -18,66 +58,222 @@ def read_root():
 
 
 @router.get("/items", response_model=List[InventoryResponse])
-def get_items_route(db: Session = Depends(get_db)):
-    items = get_item(db)
-    return items
+def get_items_route(
+    response: Response,
+    after: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    fields: Optional[str] = None,
+    format: Literal["json", "ndjson", "csv", "parquet", "arrow"] = "json",
+    sort: SortField = "item_number",
+    order: SortOrder = "asc",
+    ranges: Ranges = Depends(item_ranges),
+    db: Session = Depends(get_db),
+):
+    # X-Next-After is always an item_number; the sort value it stands for is looked up on the next request
+    descending = order == "desc"
+    if fields is None and format == "json":
+        items = get_items_page(db, after, limit, sort=sort, descending=descending, ranges=ranges).all()
+        if limit is not None and len(items) == limit:
+            response.headers["X-Next-After"] = str(items[-1].item_number)
+        return items
+
+    # Projections and exports skip ORM hydration and response model validation
+    columns = select_item_columns(fields)
+    query = get_items_page(db, after, limit, columns, sort, descending, ranges)
+    if format == "ndjson":
+        return StreamingResponse(stream_ndjson(query), media_type="application/x-ndjson")
+    if format in EXPORT_MEDIA_TYPES:
+        if format != "csv":
+            require_arrow()
+        headers = {"Content-Disposition": f'attachment; filename="inventory.{format}"'}
+        return StreamingResponse(stream_export(query, columns, format),
+                                 media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+    rows = [serialize_row(row) for row in query]
+    headers = {"X-Next-After": str(rows[-1]["item_number"])} if limit is not None and len(rows) == limit else None
+    return ORJSONResponse(rows, headers=headers)
 
 
 @router.get("/items/search", response_model=List[InventoryResponse])
-def search_items(keyword: str, db: Session = Depends(get_db)):
-    items = db.query(Inventory).filter(Inventory.item_name.ilike(f"%{keyword}%")).all()
+async def search_items(
+    keyword: str = "",
+    wear: Optional[str] = None,
+    stattrak: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    sort: Optional[SortField] = None,
+    order: SortOrder = "asc",
+    ranges: Ranges = Depends(item_ranges),
+    db: AsyncSession = Depends(get_async_db),
+):
+    items = await db.run_sync(search_inventory, keyword, wear, stattrak, limit, sort, order == "desc", ranges)
     return items
 
 
+@router.get("/portfolio/summary", response_model=PortfolioSummary)
+async def portfolio_summary(
+    keyword: Optional[str] = None,
+    wear: Optional[str] = None,
+    stattrak: Optional[bool] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(get_portfolio_summary, keyword, wear, stattrak)
+
+
+@router.get("/positions", response_model=List[PositionResponse])
+async def read_positions(
+    sort: PositionSortField = "total_value",
+    order: SortOrder = "desc",
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # One row per market item, summed over its purchase lots
+    return await db.run_sync(get_positions, sort, order == "desc", limit)
+
+
+@router.get("/portfolio/analytics", response_model=PortfolioAnalytics)
+def portfolio_analytics(db: Session = Depends(get_db)):
+    # Recomputed only when prices or holdings have changed since the last call. Imported here so that
+    # NumPy is only loaded once analytics are first asked for, not on every server start.
+    from analytics import analytics_cache
+    return analytics_cache.get(db)
+
+
 @router.get("/items/{item_number}", response_model=InventoryResponse)
-def read_item(item_number: int, db: Session = Depends(get_db)):
-    item = get_item_or_404(db, item_number)
+async def read_item(item_number: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.run_sync(get_item_or_404, item_number)
     return item
 
 
+@router.get("/items/{item_number}/history", response_model=PriceHistoryResponse)
+def item_price_history(
+    item_number: int,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    resolution: Literal["auto", "raw", "hour", "day"] = "auto",
+    db: Session = Depends(get_db),
+):
+    item = get_item_or_404(db, item_number)
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=30)
+    name = market_hash_name(item.item_link)
+    resolution, points = get_price_history(db, name, to_timestamp(start), to_timestamp(end), resolution)
+    return {"item_number": item_number, "market_hash_name": name, "resolution": resolution, "points": points}
+
+
 @router.post("/items/")
-async def new_item(item: NewItem, db: Session = Depends(get_db)):
-    new_item = create_item(db, item)
+async def new_item(item: NewItem, db: AsyncSession = Depends(get_async_db)):
+    # The price lookup is awaited rather than holding a worker thread and a pooled connection
+    current_price = await price_or_502_async(item.item_link)
+    new_item = await db.run_sync(create_item, item, current_price)
     return {"message": "Item created successfully"}
 
 
-@router.put("/items/{item_id}", response_model=InventoryResponse)
-def update_item_route(item_id: int, item: UpdateItem, db: Session = Depends(get_db)):
-    # Check if the item exists
-    existing_item = get_item_or_404(db, item_id)
+@router.post("/items/bulk", status_code=status.HTTP_201_CREATED)
+def new_items_bulk(items: List[NewItem], db: Session = Depends(get_db)):
+    prices = dict(fetch_prices(item.item_link for item in items))
+    item_numbers = create_items(db, items, prices)
+    return {"message": f"{len(item_numbers)} items created successfully", "item_numbers": item_numbers}
 
-    # Update the item's properties based on the changes in the UpdateItem object
-    if item.item_name is not None:
-        existing_item.item_name = item.item_name
 
-    if item.cost_per_item is not None:
-        existing_item.cost_per_item = str(item.cost_per_item)
+@router.patch("/items", response_model=List[InventoryResponse])
+async def update_items_route(changes: List[ItemChanges], db: AsyncSession = Depends(get_async_db)):
+    # All or nothing: an unknown item number rejects the whole batch
+    return await db.run_sync(update_items, changes)
 
-    if item.number_of_items is not None:
-        existing_item.number_of_items = str(item.number_of_items)
 
-    if item.current_price is not None:
-        existing_item.current_price = str(item.current_price)
+@router.delete("/items")
+async def delete_items_route(body: ItemNumbers, db: AsyncSession = Depends(get_async_db)):
+    deleted = await db.run_sync(delete_items, body.item_numbers)
+    return {"message": f"{deleted} items deleted successfully.", "deleted": deleted}
 
-    if item.purchase_date is not None:
-        existing_item.purchase_date = datetime.strptime(item.purchase_date, "%m/%d/%Y").strftime("%m/%d/%Y")
 
-    # Update the calculated fields
-    update_calculated_fields(existing_item)
+@router.post("/items/import")
+async def import_items_route(request: Request, pricing: Literal["defer", "fetch"] = "defer",
+                             db: Session = Depends(get_db)):
+    # The CSV body is spooled to a temporary file as it arrives, then parsed and inserted off the event loop
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        text_file = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        result = await run_in_threadpool(import_csv, db, text_file, pricing == "fetch")
+        text_file.detach()
 
-    db.commit()
+    response = result.to_dict()
+    response["refresh"] = None
+    if result.imported:
+        # Clients reload once instead of receiving an event per imported row
+        event_bus.publish({"type": "resync"})
+        if pricing == "defer":
+            response["refresh"] = (await run_in_threadpool(start_refresh)).to_dict()
+    return response
 
-    return existing_item
+
+@router.put("/items/{item_id}", response_model=InventoryResponse)
+async def update_item_route(item_id: int, item: UpdateItem, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(update_item, item_id, item)
 
 
 @router.delete("/items/{item_id}")
-def delete_item_route(item_id: int, db: Session = Depends(get_db)):
-    item = get_item_or_404(db, item_id)
-    delete_item_by_id(db, item_id)
+async def delete_item_route(item_id: int, db: AsyncSession = Depends(get_async_db)):
+    await db.run_sync(get_item_or_404, item_id)
+    await db.run_sync(delete_item_by_id, item_id)
     return {"message": "Item deleted successfully."}
 
 
 @router.post("/update/{item_id}")
-def execute_update_prices(item_id: int, db: Session = Depends(get_db)):
-    update_current_price(item_id, db)
-    return {"message": "Current price updated successfully."}
\ No newline at end of file
+async def execute_update_prices(item_id: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.run_sync(get_item_or_404, item_id)
+    current_price = await price_or_502_async(item.item_link)
+    await db.run_sync(lambda session: update_current_price(item_id, session, current_price))
+    return {"message": "Current price updated successfully."}
+
+
+@router.post("/refresh", status_code=status.HTTP_202_ACCEPTED)
+def start_refresh_route():
+    job = start_refresh()
+    return job.to_dict()
+
+
+@router.get("/refresh/{job_id}")
+def refresh_progress_route(job_id: str):
+    job = get_refresh_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Refresh job not found")
+    return job.to_dict()
+
+
+@router.get("/cache/stats")
+def price_cache_stats():
+    return price_cache.stats()
+
+
+@router.get("/provider/status")
+def price_provider_status():
+    return price_provider.price_provider.status()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/events")
+async def events_stream(request: Request):
+    # Server-Sent Events: row-level inventory changes and refresh job progress
+    queue = event_bus.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 2000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {orjson.dumps(event).decode()}\n\n"
+        finally:
+            event_bus.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,124 @@
+import heapq
+import logging
+import threading
+from datetime import datetime
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import Inventory
+from refresh import TokenBucket, apply_prices, fetch_prices, refresh_running
+from shared_state import acquire_lease, new_owner, release_lease
+from utils import market_hash_name
+
+SCHEDULER_LEASE = "price-scheduler"
+
+logger = logging.getLogger(__name__)
+
+
+def staleness_score(total_value: float, last_priced_at: Optional[datetime], now: datetime) -> float:
+    # Never-priced positions go first; otherwise age in seconds weighted by what the position is worth
+    if last_priced_at is None:
+        return float("inf")
+    age = (now - last_priced_at).total_seconds()
+    return age * (1 + max(total_value or 0, 0))
+
+
+def most_urgent_positions(db: Session, count: int, min_age: float,
+                          now: Optional[datetime] = None) -> Dict[str, List[str]]:
+    """The count positions most in need of a price, keyed by market_hash_name, each with the item links its
+    lots use. A position is priced with one lookup, as a refresh does, however many links it has."""
+    now = now or datetime.utcnow()
+    links: Dict[str, List[str]] = defaultdict(list)
+    total_values: Dict[str, float] = defaultdict(float)
+    oldest: Dict[str, Optional[datetime]] = {}
+    for item_link, total_value, last_priced_at in db.query(
+        Inventory.item_link,
+        func.sum(Inventory.total_value),
+        func.min(Inventory.last_priced_at),
+    ).group_by(Inventory.item_link):
+        name = market_hash_name(item_link)
+        links[name].append(item_link)
+        total_values[name] += total_value or 0
+        # A position is as stale as its least recently priced lot; never-priced lots make it the stalest
+        if name not in oldest or last_priced_at is None or \
+                (oldest[name] is not None and last_priced_at < oldest[name]):
+            oldest[name] = last_priced_at
+
+    queue = []
+    for name, last_priced_at in oldest.items():
+        if last_priced_at is not None and (now - last_priced_at).total_seconds() < min_age:
+            continue
+        queue.append((staleness_score(total_values[name], last_priced_at, now), name))
+    return {name: links[name] for _, name in heapq.nlargest(count, queue)}
+
+
+class PriceScheduler:
+    """Keeps prices fresh in the background, spending a fixed request budget per minute on the
+    most valuable, most stale positions first. Every worker starts one, but only the worker holding
+    the scheduler lease runs it, so the budget is spent once however many workers there are."""
+
+    def __init__(self, budget_per_minute: int, min_age: float):
+        self.budget_per_minute = budget_per_minute
+        self.min_age = min_age
+        self.limiter = TokenBucket(budget_per_minute / 60, max(1, budget_per_minute // 6), budget_per_minute / 600)
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.owner = new_owner()
+        self.refreshed = 0
+        self.failed = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="price-scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        release_lease(SCHEDULER_LEASE, self.owner)
+
+    def is_leader(self) -> bool:
+        # Renewed on every pass; if the leader exits without releasing it, another worker takes over on expiry
+        return acquire_lease(SCHEDULER_LEASE, self.owner, settings.scheduler_lease)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                worked = self.is_leader() and self.run_once()
+            except Exception:
+                logger.exception("Scheduled price refresh failed")
+                worked = False
+            # Sleep a full minute when there was nothing to do, another worker leads or a manual refresh
+            # owns the budget
+            if not worked:
+                self.stop_event.wait(60)
+
+    def run_once(self) -> bool:
+        if refresh_running():
+            return False
+
+        db = SessionLocal()
+        try:
+            positions = most_urgent_positions(db, self.budget_per_minute, self.min_age)
+            if not positions:
+                return False
+
+            batch = []
+            for item_link, price in fetch_prices((links[0] for links in positions.values()), self.limiter):
+                if self.stop_event.is_set():
+                    break
+                if price is None:
+                    self.failed += 1
+                else:
+                    batch.extend((link, price) for link in positions[market_hash_name(item_link)])
+                    self.refreshed += 1
+            if batch:
+                apply_prices(db, batch)
+            return True
+        finally:
+            db.close()
@@ -1,8 +1,17 @@
-from pydantic import BaseModel, validator
-from utils import name_finder, price_finder
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field, validator, field_serializer
+from utils import name_finder, market_hash_name
+from typing import Dict, List, Optional
+from datetime import datetime, date
 from fastapi import HTTPException
+from functools import lru_cache
+
+DATE_FORMAT = "%m/%d/%Y"
+
+
+@lru_cache(maxsize=10000)
+def parse_date(value: str) -> date:
+    # strptime is slow and bulk imports repeat the same dates over and over
+    return datetime.strptime(value, DATE_FORMAT).date()
 
 class NewItem(BaseModel):
     cost_per_item: float
@@ -13,42 +22,109 @@ class NewItem(BaseModel):
     def item_name(self) -> str:
         return name_finder(self.item_link)
 
-    @property
-    def current_price(self) -> int:
-        return price_finder(self.item_link)
-
     @property
     def total_cost(self) -> int:
         return round(self.cost_per_item * self.number_of_items,2)
 
     @property
-    def total_value(self) -> int:
-        return round(self.number_of_items * self.current_price,2)
+    def purchase_date(self) -> date:
+        return date.today()
 
-    @property
-    def total_return_dollar(self) -> int:
-        return round(self.total_value - self.total_cost, 2)
-    
-    @property
-    def total_return_percent(self) -> int:
-        return round((self.total_return_dollar / self.total_cost) * 100, 2)
+    def price_snapshot(self, current_price: float) -> "PriceSnapshot":
+        # Pricing is fetched once by the caller and every derived total is computed from that one quote
+        total_value = round(self.number_of_items * current_price, 2)
+        total_return_dollar = round(total_value - self.total_cost, 2)
+        return PriceSnapshot(
+            current_price=current_price,
+            total_value=total_value,
+            total_return_dollar=total_return_dollar,
+            total_return_percent=round((total_return_dollar / self.total_cost) * 100, 2),
+        )
+
+class PriceSnapshot(BaseModel):
+    current_price: float
+    total_value: float
+    total_return_dollar: float
+    total_return_percent: float
 
-    @property
-    def purchase_date(self) -> str:
-        return datetime.now().strftime("%m/%d/%Y")
-    
 class InventoryResponse(BaseModel):
     item_number: int    
-    purchase_date: str
+    purchase_date: Optional[date]
     item_name: str
     cost_per_item: float
     number_of_items: int
     total_cost: float
-    current_price: float
+    # None until the lot is first priced
+    current_price: Optional[float]
+    total_value: Optional[float]
+    total_return_dollar: Optional[float]
+    total_return_percent: Optional[float]
+    item_link: str
+    last_priced_at: Optional[datetime] = None
+
+    @field_serializer('purchase_date')
+    def serialize_purchase_date(self, value: Optional[date]) -> Optional[str]:
+        # Dates go over the wire in the same MM/DD/YYYY format the UI and UpdateItem use
+        return value.strftime(DATE_FORMAT) if value is not None else None
+
+class PositionResponse(BaseModel):
+    market_hash_name: str
+    item_name: str
+    item_link: str
+    lot_count: int
+    quantity: int
+    average_cost: float
+    total_cost: float
+    current_price: Optional[float]  # None while none of its lots has been priced
     total_value: float
     total_return_dollar: float
     total_return_percent: float
-    item_link: str
+    last_priced_at: Optional[datetime] = None
+
+class PortfolioSummary(BaseModel):
+    lot_count: int
+    item_count: int
+    total_cost: float
+    total_value: float
+    total_return_dollar: float
+    total_return_percent: float
+
+class PricePoint(BaseModel):
+    time: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    samples: int
+
+class PriceHistoryResponse(BaseModel):
+    item_number: int
+    market_hash_name: str
+    resolution: str
+    points: List[PricePoint]
+
+class AllocationSlice(BaseModel):
+    name: str
+    value: float
+    positions: int
+    weight_percent: float
+
+class PortfolioAnalytics(BaseModel):
+    as_of: date
+    start_date: Optional[date]
+    days: int
+    total_cost: float
+    total_value: float
+    time_weighted_return_percent: Optional[float]
+    annualized_time_weighted_return_percent: Optional[float]
+    money_weighted_return_percent: Optional[float]
+    max_drawdown_percent: Optional[float]
+    volatility_percent: Optional[float]
+    allocation: Dict[str, List[AllocationSlice]]
+
+    @field_serializer('as_of', 'start_date')
+    def serialize_dates(self, value: Optional[date]) -> Optional[str]:
+        return value.strftime(DATE_FORMAT) if value is not None else None
 
 class UpdateItem(BaseModel):
     item_name: Optional[str] = None
@@ -67,3 +143,32 @@ class UpdateItem(BaseModel):
                 # Raise an HTTPException if the format is invalid
                 raise HTTPException(status_code=400, detail="Invalid purchase date format. Use 'MM/DD/YYYY' format.")
         return value
+
+class ItemChanges(UpdateItem):
+    item_number: int
+
+class ItemNumbers(BaseModel):
+    item_numbers: List[int]
+
+class ImportRow(BaseModel):
+    item_link: str
+    number_of_items: int = Field(gt=0)
+    cost_per_item: float = Field(gt=0)
+    purchase_date: Optional[date] = None
+    current_price: Optional[float] = Field(None, ge=0)
+
+    @validator('item_link')
+    def validate_item_link(cls, value):
+        if not market_hash_name(value):
+            raise ValueError("not a Steam market listing link")
+        return value
+
+    @validator('purchase_date', pre=True)
+    def parse_purchase_date(cls, value):
+        # MM/DD/YYYY like the rest of the API; anything else is left to pydantic's ISO date parsing
+        if isinstance(value, str):
+            try:
+                return parse_date(value)
+            except ValueError:
+                pass
+        return value
@@ -0,0 +1,93 @@
+"""The API application. Importing it never loads Qt, so the server can run headless:
+
+    python main.py serve [--workers N]
+    python main.py migrate
+    INVENTORY_DATABASE_PREPARED=1 SHARED_EVENTS_ENABLED=true gunicorn -k uvicorn.workers.UvicornWorker -w N server:app
+
+Workers share price quotes, analytics results, refresh jobs and /events through the database, and only
+one of them runs the background price scheduler at a time. The database is prepared once, before the
+workers start: several workers migrating and rebuilding the trigger-maintained tables at the same
+time would contend for the write lock and could serve a half-rebuilt positions table.
+"""
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from routers import router
+from models import Inventory
+from database import engine, async_engine, SessionLocal
+from events import event_bus, install_session_events
+from metrics import MetricsMiddleware, install_metrics
+from config import settings
+from migrate import migrate, sqlite_path
+from price_cache import price_cache
+import price_provider
+from price_history import record_fetched_price
+from scheduler import PriceScheduler
+
+# Set by whoever prepared the database for the worker processes it then starts
+PREPARED_ENV = "INVENTORY_DATABASE_PREPARED"
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_database():
+    # Upgrade an existing database file, then create the database tables (if needed). Creating them also
+    # rebuilds the trigger-maintained tables (portfolio totals, positions, the search index) from inventory.
+    if sqlite_path() is not None:
+        for step in migrate(sqlite_path()):
+            logger.info(step)
+    Inventory.metadata.create_all(bind=engine)
+    os.environ[PREPARED_ENV] = "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Single process servers started without serve() prepare the database themselves
+    if not os.environ.get(PREPARED_ENV):
+        prepare_database()
+    scheduler = None
+    if settings.scheduler_enabled:
+        scheduler = PriceScheduler(settings.scheduler_budget_per_minute, settings.scheduler_min_age)
+        scheduler.start()
+    app.state.scheduler = scheduler
+    if settings.shared_events_enabled:
+        event_bus.start_relay()
+    yield
+    if scheduler is not None:
+        scheduler.stop()
+    event_bus.stop_relay()
+    await price_provider.price_provider.aclose()
+    await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Add the router to the app
+app.include_router(router)
+app.add_middleware(MetricsMiddleware)
+
+# Keep a price history of every quote fetched from Steam
+price_cache.add_listener(record_fetched_price)
+
+# Publish row-level inventory changes to /events subscribers
+install_session_events(SessionLocal)
+
+# Request, SQL, session, price fetch and refresh figures for GET /metrics
+install_metrics(SessionLocal, engine, async_engine.sync_engine)
+
+
+def serve(host: str = None, port: int = None, reload: bool = None, workers: int = None):
+    import uvicorn
+    reload = settings.server_reload if reload is None else reload
+    workers = workers or settings.server_workers
+    prepare_database()
+    if workers > 1:
+        # Each worker only streams its own events to its /events clients unless they are relayed
+        os.environ["SHARED_EVENTS_ENABLED"] = "true"
+    if workers > 1 or reload:
+        # This process only supervises; the workers import the app again and open their own connections,
+        # finding the database already prepared
+        engine.dispose()
+    uvicorn.run("server:app", host=host or settings.server_host, port=port or settings.server_port,
+                reload=reload, workers=workers, lifespan="on")
@@ -1,34 +1,72 @@
 from datetime import datetime
 from sqlalchemy.orm import Session
-from models import Inventory
-from schemas import NewItem
-from typing import Optional
-from utils import price_finder
-import time
+from models import Inventory, PortfolioTotals, Position
+from schemas import NewItem, ItemChanges, UpdateItem, DATE_FORMAT
+from typing import Dict, Iterator, List, Optional, Tuple
+import orjson
+import re
+from price_cache import cached_price, cached_price_async
+from price_provider import PriceFetchError
 from fastapi import HTTPException, status
-from PyQt5.QtWidgets import QProgressDialog
-from PyQt5.QtCore import Qt
+from events import item_event
+from sqlalchemy import Float, and_, bindparam, case, cast, column, delete, func, literal_column, or_, select, table, tuple_, update
 
 
-def create_item(db: Session, item: NewItem):
-    item_data = Inventory(
-        # purchase_date=datetime.utcnow(),
-        purchase_date=datetime.strptime(item.purchase_date, "%m/%d/%Y").strftime("%m/%d/%Y"),
+def build_inventory_item(item: NewItem, current_price: float) -> Inventory:
+    snapshot = item.price_snapshot(current_price)
+    last_priced_at = datetime.utcnow()
+    return Inventory(
+        purchase_date=item.purchase_date,
         item_name=item.item_name,
-        cost_per_item=str(item.cost_per_item),
+        cost_per_item=item.cost_per_item,
         number_of_items=item.number_of_items,
-        total_cost=str(item.total_cost),
-        current_price=str(item.current_price),
-        total_value=str(item.total_value),
-        total_return_dollar=str(item.total_return_dollar),
-        total_return_percent=str(item.total_return_percent),
-        item_link=item.item_link
+        total_cost=item.total_cost,
+        current_price=snapshot.current_price,
+        total_value=snapshot.total_value,
+        total_return_dollar=snapshot.total_return_dollar,
+        total_return_percent=snapshot.total_return_percent,
+        item_link=item.item_link,
+        last_priced_at=last_priced_at
     )
+
+
+def price_or_502(item_link: str) -> float:
+    try:
+        return cached_price(item_link)
+    except PriceFetchError as exc:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Price lookup failed: {exc}")
+
+
+async def price_or_502_async(item_link: str) -> float:
+    try:
+        return await cached_price_async(item_link)
+    except PriceFetchError as exc:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Price lookup failed: {exc}")
+
+
+def create_item(db: Session, item: NewItem, current_price: Optional[float] = None):
+    if current_price is None:
+        current_price = price_or_502(item.item_link)
+    item_data = build_inventory_item(item, current_price)
     db.add(item_data)
     db.commit()
     db.refresh(item_data)
     return item_data
 
+
+def create_items(db: Session, items: List[NewItem], prices: Dict[str, Optional[float]]) -> List[int]:
+    # All rows go in with a single commit, and only once every price is known, like create_item
+    failed = sorted({item.item_link for item in items if prices.get(item.item_link) is None})
+    if failed:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
+                            detail={"message": "Price lookup failed", "item_links": failed})
+    records = [build_inventory_item(item, prices[item.item_link]) for item in items]
+    db.add_all(records)
+    db.flush()
+    item_numbers = [record.item_number for record in records]
+    db.commit()
+    return item_numbers
+
 def get_item_or_404(db: Session, item_id: int) -> Inventory:
     item = get_item(db, item_id)
     if item is None:
@@ -43,15 +81,244 @@ def get_item(db: Session, item_number: Optional[int] = None):
         return db.query(Inventory).all()
     
 
-def update_calculated_fields(item: Inventory):
-    current_price = float(item.current_price)
-    number_of_items = float(item.number_of_items)
-    cost_per_item = float(item.cost_per_item)
+ITEM_FIELDS = [column.key for column in Inventory.__table__.columns]
+
+
+def select_item_columns(fields: Optional[str]) -> list:
+    if not fields:
+        return list(Inventory.__table__.columns)
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ITEM_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(unknown)}")
+    # item_number is always included since it is the pagination cursor
+    if "item_number" not in names:
+        names.insert(0, "item_number")
+    return [Inventory.__table__.c[name] for name in names]
+
+
+# Columns with their own index, which can be sorted on and filtered by range without a table scan
+RANGE_FIELDS = ["purchase_date", "current_price", "total_value", "total_return_percent"]
+SORT_FIELDS = ["item_number"] + RANGE_FIELDS
+
+Ranges = Dict[str, Tuple[Optional[object], Optional[object]]]
+
+
+def filter_ranges(query, ranges: Optional[Ranges] = None):
+    for field, (low, high) in (ranges or {}).items():
+        sort_column = Inventory.__table__.c[field]
+        if low is not None:
+            query = query.filter(sort_column >= low)
+        if high is not None:
+            query = query.filter(sort_column <= high)
+    return query
+
+
+def order_items(query, sort: str = "item_number", descending: bool = False):
+    # item_number breaks ties; every secondary index already ends in it (it is the rowid), so this stays an index scan
+    sort_columns = [Inventory.__table__.c[sort]]
+    if sort != "item_number":
+        sort_columns.append(Inventory.item_number)
+    return query.order_by(*[sort_column.desc() if descending else sort_column for sort_column in sort_columns])
+
+
+def after_cursor(db: Session, sort: str, after: int, descending: bool = False):
+    if sort == "item_number":
+        return Inventory.item_number < after if descending else Inventory.item_number > after
+
+    sort_column = Inventory.__table__.c[sort]
+    cursor = db.query(sort_column).filter(Inventory.item_number == after).first()
+    if cursor is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Cursor item {after} does not exist")
+
+    # Compare (value, item_number) as a row value; NULL dates sort first ascending and last descending
+    value = cursor[0]
+    if value is None:
+        if descending:
+            return and_(sort_column.is_(None), Inventory.item_number < after)
+        return or_(sort_column.isnot(None), Inventory.item_number > after)
+    if descending:
+        return or_(tuple_(sort_column, Inventory.item_number) < tuple_(value, after), sort_column.is_(None))
+    return tuple_(sort_column, Inventory.item_number) > tuple_(value, after)
+
+
+def get_items_page(db: Session, after: Optional[int] = None, limit: Optional[int] = None, columns: Optional[list] = None,
+                   sort: str = "item_number", descending: bool = False, ranges: Optional[Ranges] = None):
+    # Keyset pagination on (sort column, item_number): each page is an index range scan, however deep it is
+    query = db.query(*columns) if columns else db.query(Inventory)
+    query = order_items(filter_ranges(query, ranges), sort, descending)
+    if after is not None:
+        query = query.filter(after_cursor(db, sort, after, descending))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def serialize_row(row) -> dict:
+    data = dict(row._mapping)
+    if data.get("purchase_date") is not None:
+        data["purchase_date"] = data["purchase_date"].strftime(DATE_FORMAT)
+    return data
+
+
+def stream_ndjson(query, chunk_size: int = 1000) -> Iterator[bytes]:
+    chunk = []
+    for row in query.yield_per(chunk_size):
+        chunk.append(orjson.dumps(serialize_row(row)))
+        if len(chunk) == chunk_size:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+
+inventory_fts = table("inventory_fts", column("rowid"), column("rank"))
+
+
+def build_match_query(keyword: Optional[str] = None, wear: Optional[str] = None,
+                      stattrak: Optional[bool] = None) -> Optional[str]:
+    # "ak redline field" becomes item_name : ("ak"* "redline"* "field"*), i.e. every token as a prefix
+    clauses = []
+    tokens = re.findall(r"\w+", keyword or "")
+    if tokens:
+        clauses.append("item_name : (" + " ".join(f'"{token}"*' for token in tokens) + ")")
+    if wear:
+        clauses.append('wear : "' + " ".join(re.findall(r"\w+", wear)) + '"')
+    if stattrak is not None:
+        clauses.append("flags : " + ("stattrak" if stattrak else "nostattrak"))
+    return " AND ".join(clauses) or None
+
+
+def filter_items(db: Session, query, keyword: Optional[str] = None, wear: Optional[str] = None,
+                 stattrak: Optional[bool] = None, ranked: bool = False):
+    match = build_match_query(keyword, wear, stattrak)
+    if match is None:
+        return query
+
+    if db.bind.dialect.name != "sqlite":
+        # No FTS5 index outside SQLite, so fall back to substring matching on the name
+        for token in re.findall(r"\w+", keyword or ""):
+            query = query.filter(Inventory.item_name.ilike(f"%{token}%"))
+        if wear:
+            query = query.filter(Inventory.item_name.ilike(f"%({wear})"))
+        if stattrak is not None:
+            stattrak_filter = Inventory.item_name.contains("StatTrak")
+            query = query.filter(stattrak_filter if stattrak else ~stattrak_filter)
+        return query
 
-    item.total_value = "{:.2f}".format(round(number_of_items * current_price, 2))
-    item.total_cost = "{:.2f}".format(round(number_of_items * cost_per_item, 2))
-    item.total_return_dollar = "{:.2f}".format(round(float(item.total_value) - float(item.total_cost), 2))
-    item.total_return_percent = "{:.2f}".format(round((float(item.total_return_dollar) / float(item.total_cost)) * 100, 2))
+    matches = (
+        select(inventory_fts.c.rowid, inventory_fts.c.rank)
+        .where(literal_column("inventory_fts").op("MATCH")(match))
+        .subquery()
+    )
+    query = query.join(matches, Inventory.item_number == matches.c.rowid)
+    if ranked:
+        query = query.order_by(matches.c.rank)
+    return query
+
+
+def search_inventory(db: Session, keyword: Optional[str] = None, wear: Optional[str] = None,
+                     stattrak: Optional[bool] = None, limit: Optional[int] = None, sort: Optional[str] = None,
+                     descending: bool = False, ranges: Optional[Ranges] = None) -> List[Inventory]:
+    # Results are ordered by relevance unless a sort column is asked for
+    query = filter_items(db, db.query(Inventory), keyword, wear, stattrak, ranked=sort is None)
+    query = filter_ranges(query, ranges)
+    if sort is not None:
+        query = order_items(query, sort, descending)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def get_portfolio_summary(db: Session, keyword: Optional[str] = None, wear: Optional[str] = None,
+                          stattrak: Optional[bool] = None) -> dict:
+    unfiltered = build_match_query(keyword, wear, stattrak) is None
+    totals = db.query(PortfolioTotals).get(1) if unfiltered else None
+    if totals is not None:
+        lot_count, item_count = totals.lot_count, totals.item_count
+        total_cost, total_value, total_return_dollar = totals.total_cost, totals.total_value, totals.total_return_dollar
+    else:
+        # Filtered summaries (and databases without the totals triggers) aggregate in SQL instead
+        query = db.query(
+            func.count(Inventory.item_number),
+            func.coalesce(func.sum(Inventory.number_of_items), 0),
+            func.coalesce(func.sum(Inventory.total_cost), 0),
+            func.coalesce(func.sum(Inventory.total_value), 0),
+            func.coalesce(func.sum(Inventory.total_return_dollar), 0),
+        )
+        query = filter_items(db, query, keyword, wear, stattrak)
+        lot_count, item_count, total_cost, total_value, total_return_dollar = query.one()
+
+    return {
+        "lot_count": lot_count,
+        "item_count": item_count,
+        "total_cost": round(total_cost, 2),
+        "total_value": round(total_value, 2),
+        "total_return_dollar": round(total_return_dollar, 2),
+        "total_return_percent": round(total_return_dollar / total_cost * 100, 2) if total_cost else 0,
+    }
+
+
+def position_source(db: Session):
+    if db.bind.dialect.name == "sqlite":
+        return Position.__table__
+    # Databases without the positions triggers group the lots on every call instead
+    return (
+        select(
+            func.substr(Inventory.item_link, 48).label("market_hash_name"),
+            func.min(Inventory.item_name).label("item_name"),
+            func.min(Inventory.item_link).label("item_link"),
+            func.count(Inventory.item_number).label("lot_count"),
+            func.sum(Inventory.number_of_items).label("quantity"),
+            func.sum(Inventory.total_cost).label("total_cost"),
+            func.max(Inventory.current_price).label("current_price"),
+            func.sum(Inventory.total_value).label("total_value"),
+            func.sum(Inventory.total_return_dollar).label("total_return_dollar"),
+            func.max(Inventory.last_priced_at).label("last_priced_at"),
+        )
+        .group_by(func.substr(Inventory.item_link, 48))
+        .subquery()
+    )
+
+
+def get_positions(db: Session, sort: str = "total_value", descending: bool = True,
+                  limit: Optional[int] = None) -> List[dict]:
+    positions = position_source(db)
+    # SQLite keeps whole-dollar amounts as integers, so divide as floats to avoid integer division
+    total_cost = cast(positions.c.total_cost, Float)
+    average_cost = case((positions.c.quantity > 0, total_cost / positions.c.quantity), else_=0)
+    total_return_percent = case((positions.c.total_cost != 0,
+                                 positions.c.total_return_dollar * 100 / total_cost), else_=0)
+    columns = {
+        **{column.name: column for column in positions.c},
+        "average_cost": average_cost.label("average_cost"),
+        "total_return_percent": total_return_percent.label("total_return_percent"),
+    }
+    sort_column = columns[sort]
+    query = select(*columns.values()).order_by(sort_column.desc() if descending else sort_column,
+                                               positions.c.market_hash_name)
+    if limit is not None:
+        query = query.limit(limit)
+
+    rows = [dict(row._mapping) for row in db.execute(query)]
+    for row in rows:
+        for field in ("average_cost", "total_cost", "total_value", "total_return_dollar", "total_return_percent"):
+            row[field] = round(float(row[field] or 0), 2)
+        if row["current_price"] is not None:
+            row["current_price"] = round(float(row["current_price"]), 2)
+    return rows
+
+
+def update_calculated_fields(item: Inventory):
+    item.total_cost = round(item.number_of_items * item.cost_per_item, 2)
+    if item.current_price is None:
+        # Unpriced lots have no value yet, rather than a value of 0
+        item.total_value = item.total_return_dollar = item.total_return_percent = None
+        return
+    item.total_value = round(item.number_of_items * item.current_price, 2)
+    item.total_return_dollar = round(item.total_value - item.total_cost, 2)
+    item.total_return_percent = round((item.total_return_dollar / item.total_cost) * 100, 2)
 
 
 def delete_item_by_id(db: Session, item_number: int):
@@ -62,38 +329,120 @@ def delete_item_by_id(db: Session, item_number: int):
     return item
 
 
-def update_current_prices(db: Session):
-    items = db.query(Inventory).all()
-    total_items = len(items)
+def update_item(db: Session, item_id: int, changes: UpdateItem) -> Inventory:
+    existing_item = get_item_or_404(db, item_id)
 
-    for i, item in enumerate(items):
-        current_price = price_finder(item.item_link)
+    # Update the item's properties based on the changes in the UpdateItem object
+    if changes.item_name is not None:
+        existing_item.item_name = changes.item_name
 
-        # Update current_price
-        item.current_price = current_price
+    if changes.cost_per_item is not None:
+        existing_item.cost_per_item = changes.cost_per_item
 
-        # Update other calculated fields
-        update_calculated_fields(item)
+    if changes.number_of_items is not None:
+        existing_item.number_of_items = changes.number_of_items
 
-        # Print message to indicate progress
-        print(f"Updated current price and calculated fields for Item {item.item_number}")
+    if changes.current_price is not None:
+        existing_item.current_price = changes.current_price
 
-        # Yield the progress status
-        yield {
-            "progress": i + 1,
-            "total_items": total_items,
-            "message": f"Updated current price and calculated fields for Item {item.item_number}"
-        }
+    if changes.purchase_date is not None:
+        existing_item.purchase_date = datetime.strptime(changes.purchase_date, DATE_FORMAT).date()
 
-        # Delay between requests to avoid timing out
-        time.sleep(3.5)
+    # Update the calculated fields
+    update_calculated_fields(existing_item)
 
     db.commit()
+    return existing_item
 
-def update_current_price(item_number: int, db: Session):
-    item = get_item(db, item_number)
-    current_price = price_finder(item.item_link)
-    item.current_price = current_price
+
+def update_current_price(item_number: int, db: Session, current_price: Optional[float] = None):
+    item = get_item_or_404(db, item_number)
+    item.current_price = price_or_502(item.item_link) if current_price is None else current_price
+    item.last_priced_at = datetime.utcnow()
     update_calculated_fields(item)
     db.commit()
+
+
+BATCH_CHUNK_SIZE = 500  # item numbers per IN (...) list, well under SQLite's bound parameter limit
+EDITABLE_FIELDS = ["item_name", "cost_per_item", "number_of_items", "current_price", "purchase_date"]
+
+
+def chunked(values: List[int], size: int = BATCH_CHUNK_SIZE) -> Iterator[List[int]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def calculated_field_values(current_price=Inventory.current_price) -> dict:
+    # The SQL counterpart of update_calculated_fields. Every SET expression sees the row as it was
+    # before the UPDATE, so each total is spelled out from the stored inputs rather than the new totals.
+    # Pass the new price (e.g. a bindparam) when the same UPDATE also sets current_price.
+    total_cost = func.round(Inventory.number_of_items * Inventory.cost_per_item, 2)
+    total_value = func.round(Inventory.number_of_items * current_price, 2)
+    total_return_dollar = func.round(total_value - total_cost, 2)
+    return {
+        "total_cost": total_cost,
+        "total_value": total_value,
+        "total_return_dollar": total_return_dollar,
+        "total_return_percent": case((total_cost == 0, 0), else_=func.round(total_return_dollar / total_cost * 100, 2)),
+    }
+
+
+def require_items(db: Session, item_numbers: List[int]):
+    if len(set(item_numbers)) != len(item_numbers):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Each item number may only appear once")
+    found = set()
+    for chunk in chunked(item_numbers):
+        found.update(number for (number,) in db.query(Inventory.item_number).filter(Inventory.item_number.in_(chunk)))
+    missing = sorted(set(item_numbers) - found)
+    if missing:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail={"message": "Items not found", "item_numbers": missing})
+
+
+def queue_item_events(db: Session, events: List[dict]):
+    # Core statements bypass the flush hooks, so the events are queued for the after_commit publisher by hand
+    db.info.setdefault("pending_events", []).extend(events)
+
+
+def update_items(db: Session, changes: List[ItemChanges]) -> List[Inventory]:
+    """Apply per-item changes and recompute the derived totals for all of them in one transaction."""
+    item_numbers = [change.item_number for change in changes]
+    require_items(db, item_numbers)
+
+    # Rows changing the same set of columns share one executemany UPDATE
+    groups: Dict[Tuple[str, ...], List[dict]] = {}
+    for change in changes:
+        values = change.model_dump(include=set(EDITABLE_FIELDS), exclude_none=True)
+        if "purchase_date" in values:
+            values["purchase_date"] = datetime.strptime(values["purchase_date"], DATE_FORMAT).date()
+        if values:
+            groups.setdefault(tuple(sorted(values)), []).append({"key": change.item_number, **values})
+
+    inventory = Inventory.__table__
+    for fields, params in groups.items():
+        statement = (
+            update(inventory)
+            .where(inventory.c.item_number == bindparam("key"))
+            .values({field: bindparam(field) for field in fields})
+        )
+        db.execute(statement, params)
+
+    items = []
+    for chunk in chunked(item_numbers):
+        db.execute(update(inventory).where(inventory.c.item_number.in_(chunk)).values(calculated_field_values()))
+        items.extend(db.query(Inventory).filter(Inventory.item_number.in_(chunk)).populate_existing())
+    items.sort(key=lambda item: item.item_number)
+    queue_item_events(db, [item_event("item.updated", item) for item in items])
+    db.commit()
+    return items
+
+
+def delete_items(db: Session, item_numbers: List[int]) -> int:
+    require_items(db, item_numbers)
+    inventory = Inventory.__table__
+    for chunk in chunked(item_numbers):
+        db.execute(delete(inventory).where(inventory.c.item_number.in_(chunk)))
+    queue_item_events(db, [{"type": "item.deleted", "item_number": number} for number in item_numbers])
+    db.commit()
+    return len(item_numbers)
     
\ No newline at end of file
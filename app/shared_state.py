@@ -0,0 +1,79 @@
+import time
+import uuid
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from database import engine
+from models import DataVersion, Inventory, Lease, SharedResult
+
+
+def new_owner() -> str:
+    return uuid.uuid4().hex
+
+
+def upsert(model):
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def acquire_lease(name: str, owner: str, seconds: float) -> bool:
+    # Takes the lease if it is free or has expired, and extends it if owner already holds it.
+    # Each call commits on its own so other workers see the lease straight away.
+    now = time.time()
+    statement = upsert(Lease).values(name=name, owner=owner, expires_at=now + seconds)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Lease.name],
+        set_={"owner": statement.excluded.owner, "expires_at": statement.excluded.expires_at},
+        where=(Lease.expires_at < now) | (Lease.owner == owner),
+    )
+    with engine.begin() as conn:
+        return conn.execute(statement).rowcount == 1
+
+
+def release_lease(name: str, owner: str, conn: Optional[Connection] = None):
+    # Pass conn to release as part of a transaction that is already open
+    if conn is None:
+        with engine.begin() as conn:
+            return release_lease(name, owner, conn)
+    conn.execute(delete(Lease).where(Lease.name == name, Lease.owner == owner))
+
+
+def lease_holder(name: str) -> Optional[str]:
+    with engine.connect() as conn:
+        return conn.execute(select(Lease.owner).where(Lease.name == name, Lease.expires_at >= time.time())).scalar()
+
+
+def data_version(db: Session) -> str:
+    if db.bind.dialect.name == "sqlite":
+        # Bumped by triggers on every write to the inventory, from whichever process made it
+        return str(db.execute(select(DataVersion.version).where(DataVersion.name == "inventory")).scalar() or 0)
+    # Other databases have no version triggers, so the version is read off the inventory itself
+    fingerprint = db.execute(select(
+        func.count(Inventory.item_number),
+        func.max(Inventory.item_number),
+        func.max(Inventory.last_priced_at),
+        func.sum(Inventory.number_of_items),
+        func.sum(Inventory.total_cost),
+        func.sum(Inventory.total_value),
+    )).one()
+    return "/".join(map(str, fingerprint))
+
+
+def load_result(key: str, version: str) -> Optional[bytes]:
+    with engine.connect() as conn:
+        return conn.execute(select(SharedResult.value).where(SharedResult.key == key,
+                                                             SharedResult.version == version)).scalar()
+
+
+def save_result(key: str, version: str, value: bytes):
+    statement = upsert(SharedResult).values(key=key, version=version, value=value)
+    statement = statement.on_conflict_do_update(
+        index_elements=[SharedResult.key],
+        set_={"version": statement.excluded.version, "value": statement.excluded.value},
+    )
+    with engine.begin() as conn:
+        conn.execute(statement)
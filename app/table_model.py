@@ -0,0 +1,165 @@
+from typing import Dict, List, Optional
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Qt
+
+COLUMNS = [
+    ("item_number", "Item Number"),
+    ("purchase_date", "Purchase Date"),
+    ("item_name", "Item Name"),
+    ("cost_per_item", "Cost per Item"),
+    ("number_of_items", "Number of Items"),
+    ("total_cost", "Total Cost"),
+    ("current_price", "Current Price"),
+    ("total_value", "Total Value"),
+    ("total_return_dollar", "Total Return Dollar"),
+]
+
+# One row per market item, as served by /positions; the item name stands in for the item number as row key
+POSITION_COLUMNS = [
+    ("item_name", "Item Name"),
+    ("lot_count", "Lots"),
+    ("quantity", "Quantity"),
+    ("average_cost", "Average Cost"),
+    ("total_cost", "Total Cost"),
+    ("current_price", "Current Price"),
+    ("total_value", "Total Value"),
+    ("total_return_dollar", "Total Return Dollar"),
+    ("total_return_percent", "Total Return Percent"),
+]
+
+SORT_ROLE = Qt.UserRole
+
+
+def sort_key(field: str, value):
+    # Dates arrive as MM/DD/YYYY, which only sorts correctly once turned around
+    if field == "purchase_date" and value:
+        month, day, year = value.split("/")
+        return f"{year}-{month}-{day}"
+    return value
+
+
+def row_key(field: str, column: int, row: tuple) -> tuple:
+    # Empty cells sort last and are never compared against real values
+    value = sort_key(field, row[column])
+    return (value is None, value if value is not None else 0)
+
+
+class InventoryTableModel(QAbstractTableModel):
+    """Inventory rows stored as plain tuples. The view asks for visible cells only, and changes
+    are applied row by row with targeted signals instead of resetting the whole table.
+    The first of the columns identifies a row."""
+
+    def __init__(self, parent=None, columns=COLUMNS):
+        super().__init__(parent)
+        self.columns = columns
+        self.fields = [field for field, _ in columns]
+        self._rows: List[tuple] = []
+        self._row_by_item: Dict[int, int] = {}
+        self._sort_column: Optional[int] = None
+        self._sort_order = Qt.AscendingOrder
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self._rows[index.row()][index.column()]
+        if role == Qt.DisplayRole:
+            return "" if value is None else str(value)
+        if role == SORT_ROLE:
+            return sort_key(self.fields[index.column()], value)
+        if role == Qt.TextAlignmentRole and isinstance(value, (int, float)):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section][1]
+        return super().headerData(section, orientation, role)
+
+    def _to_row(self, item: dict) -> tuple:
+        return tuple(item[field] for field in self.fields)
+
+    def _row_key(self, row: tuple) -> tuple:
+        return row_key(self.fields[self._sort_column], self._sort_column, row)
+
+    def _sort_rows(self):
+        if self._sort_column is not None:
+            self._rows.sort(key=self._row_key, reverse=self._sort_order == Qt.DescendingOrder)
+        self._row_by_item = {row[0]: position for position, row in enumerate(self._rows)}
+
+    def sort(self, column: int, order=Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        self._sort_column, self._sort_order = column, order
+        self._sort_rows()
+        self.layoutChanged.emit()
+
+    def set_items(self, items: List[dict]):
+        self.beginResetModel()
+        self._rows = [self._to_row(item) for item in items]
+        self._sort_rows()
+        self.endResetModel()
+
+    def has_item(self, item_number: int) -> bool:
+        return item_number in self._row_by_item
+
+    def _insert_position(self, row: tuple) -> int:
+        if self._sort_column is None:
+            return len(self._rows)
+        key = self._row_key(row)
+        descending = self._sort_order == Qt.DescendingOrder
+        low, high = 0, len(self._rows)
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = self._row_key(self._rows[middle])
+            if (middle_key >= key) if descending else (middle_key <= key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def upsert_item(self, item: dict):
+        row = self._to_row(item)
+        position = self._row_by_item.get(row[0])
+        if position is not None:
+            old_row = self._rows[position]
+            if self._sort_column is None or \
+                    self._row_key(row) == self._row_key(old_row):
+                self._rows[position] = row
+                self.dataChanged.emit(self.index(position, 0), self.index(position, len(self.columns) - 1))
+                return
+            # The sorted value changed, so the row has to move
+            self.remove_item(row[0])
+
+        position = self._insert_position(row)
+        self.beginInsertRows(QModelIndex(), position, position)
+        self._rows.insert(position, row)
+        for later_row in self._rows[position + 1:]:
+            self._row_by_item[later_row[0]] += 1
+        self._row_by_item[row[0]] = position
+        self.endInsertRows()
+
+    def remove_item(self, item_number: int):
+        position = self._row_by_item.pop(item_number, None)
+        if position is None:
+            return
+        self.beginRemoveRows(QModelIndex(), position, position)
+        del self._rows[position]
+        for row in self._rows[position:]:
+            self._row_by_item[row[0]] -= 1
+        self.endRemoveRows()
+
+    def item_number(self, position: int) -> Optional[int]:
+        return self._rows[position][0] if 0 <= position < len(self._rows) else None
+
+
+class InventoryProxyModel(QSortFilterProxyModel):
+    """Sorting is handed to the source model: one Python list sort is far cheaper than the proxy calling
+    back into data() for every comparison, and it keeps targeted row signals working on large tables."""
+
+    def sort(self, column: int, order=Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
@@ -1,20 +1,30 @@
 from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout, \
-    QWidget, QTableWidget, QTableWidgetItem, QMessageBox, QProgressBar, QGridLayout
+    QWidget, QTableView, QMessageBox, QProgressBar, QGridLayout, QAbstractItemView
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import QCoreApplication, QEvent, Qt
-from typing import List
-from requests import get, post, put, delete
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
+from table_model import InventoryTableModel, InventoryProxyModel, POSITION_COLUMNS, SORT_ROLE
+from api_client import ApiClient
+from typing import List, Optional
+from requests import get
 from pydantic import BaseModel
+import json
 import sys
-import time
-import threading
 
 
 # FastAPI routes information
 BASE_URL = "http://localhost:8000"
 ITEMS_URL = f"{BASE_URL}/items"
 UPDATE_PRICES_URL = f"{BASE_URL}/update"
+REFRESH_URL = f"{BASE_URL}/refresh"
+SUMMARY_URL = f"{BASE_URL}/portfolio/summary"
+POSITIONS_URL = f"{BASE_URL}/positions"
 ADD_ITEM_URL = f"{BASE_URL}/items/"
+EVENTS_URL = f"{BASE_URL}/events"
+
+
+def parse_item_numbers(text: str) -> List[int]:
+    # "3, 7 12" -> [3, 7, 12]; raises ValueError on anything that is not a number
+    return [int(number) for number in text.replace(",", " ").split()]
 
 
 class InventoryItem(BaseModel):
@@ -24,13 +34,56 @@ class InventoryItem(BaseModel):
     cost_per_item: float
     number_of_items: int
     total_cost: float
-    current_price: float
-    total_value: float
-    total_return_dollar: float
-    total_return_percent: float
+    current_price: Optional[float]
+    total_value: Optional[float]
+    total_return_dollar: Optional[float]
+    total_return_percent: Optional[float]
+
+
+class EventStreamThread(QThread):
+    """Reads the server's /events stream and re-emits each event on the GUI thread. Reconnects with backoff."""
+    connected = pyqtSignal()
+    event_received = pyqtSignal(dict)
+
+    response = None
+
+    def run(self):
+        delay = 1
+        while not self.isInterruptionRequested():
+            try:
+                with get(EVENTS_URL, stream=True, timeout=(5, 60)) as response:
+                    self.response = response
+                    response.raise_for_status()
+                    self.connected.emit()
+                    delay = 1
+                    data = []
+                    for line in response.iter_lines(decode_unicode=True):
+                        if self.isInterruptionRequested():
+                            return
+                        if line.startswith('data:'):
+                            data.append(line[5:].strip())
+                        elif not line and data:
+                            self.event_received.emit(json.loads('\n'.join(data)))
+                            data = []
+            except Exception:
+                pass
+            for _ in range(delay * 10):
+                if self.isInterruptionRequested():
+                    return
+                self.msleep(100)
+            delay = min(delay * 2, 30)
+
+    def stop(self):
+        # Closing the response unblocks the read the thread is waiting in
+        self.requestInterruption()
+        if self.response is not None:
+            self.response.close()
+        self.wait(2000)
 
 
 class MainWindow(QMainWindow):
+    refresh_progress = pyqtSignal(dict)
+
     def __init__(self):
         super().__init__()
 
@@ -48,16 +101,29 @@ class MainWindow(QMainWindow):
         self.text_input = QLineEdit(self)
         self.search_button = QPushButton('Search', self)
         self.clear_button = QPushButton('Clear', self)
+        self.group_button = QPushButton('Group by Item', self)
+        self.group_button.setCheckable(True)
         self.search_layout.addWidget(self.search_label)
         self.search_layout.addWidget(self.text_input)
         self.search_layout.addWidget(self.search_button)
         self.search_layout.addWidget(self.clear_button)
-
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(9)
-        self.table.setHorizontalHeaderLabels(["Item Number", "Purchase Date", "Item Name", "Cost per Item",
-                                              "Number of Items", "Total Cost", "Current Price", "Total Value",
-                                              "Total Return Dollar"])
+        self.search_layout.addWidget(self.group_button)
+
+        self.table_model = InventoryTableModel(self)
+        # Grouped mode shows one row per market item, summed over its purchase lots by the server
+        self.position_model = InventoryTableModel(self, POSITION_COLUMNS)
+        self.proxy_model = InventoryProxyModel(self)
+        self.proxy_model.setSourceModel(self.table_model)
+        self.proxy_model.setSortRole(SORT_ROLE)
+
+        self.table = QTableView(self)
+        self.table.setModel(self.proxy_model)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(0, Qt.AscendingOrder)
+        # Ctrl/Shift-click selects several rows for the batch update and delete windows
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.table.verticalHeader().setDefaultSectionSize(22)
 
         self.stats_layout = QGridLayout()
         self.stats_layout.setHorizontalSpacing(10)  # Set horizontal spacing between columns
@@ -117,102 +183,161 @@ class MainWindow(QMainWindow):
 
         self.search_button.clicked.connect(self.search_items)
         self.clear_button.clicked.connect(self.clear_search)
+        self.group_button.toggled.connect(self.set_grouped)
         self.add_item_button.clicked.connect(self.open_add_item_window)
         self.update_item_button.clicked.connect(self.open_update_item_window)
         self.update_prices_button.clicked.connect(self.open_update_prices_window)
         self.delete_item_button.clicked.connect(self.open_delete_item_window)
 
-        self.update_table()
-        self.update_statistics()
-
-    def search_items(self):
-        keyword = self.text_input.text()
-        response = get(f'{ITEMS_URL}/search?keyword={keyword}')
+        self.active_keyword = None
+        self.grouped = False
+
+        # All requests run off the GUI thread; a newer load or statistics request supersedes an older one
+        self.api = ApiClient(self)
+        self.pending_load = None
+        self.pending_stats = None
+
+        # Coalesce bursts of change events into a single statistics request
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setSingleShot(True)
+        self.stats_timer.setInterval(250)
+        self.stats_timer.timeout.connect(lambda: self.update_statistics(self.active_keyword))
+
+        # Positions are regrouped on the server, so item events are coalesced into one reload of them
+        self.positions_timer = QTimer(self)
+        self.positions_timer.setSingleShot(True)
+        self.positions_timer.setInterval(250)
+        self.positions_timer.timeout.connect(self.update_positions)
+
+        # The table is loaded whenever the event stream (re)connects, and kept current from its events after that
+        self.event_stream = EventStreamThread(self)
+        self.event_stream.connected.connect(self.reload)
+        self.event_stream.event_received.connect(self.apply_event)
+        self.event_stream.start()
+
+    def load(self, url: str, params, keyword, error_message: str):
+        if self.pending_load is not None:
+            self.pending_load.cancel()
+        self.pending_load = self.api.get(
+            url, params=params,
+            on_success=lambda response: self.on_items_loaded(response, keyword, error_message),
+            on_error=lambda error: self.show_error_popup('Error', f'{error_message}\n{error}'),
+        )
+
+    def on_items_loaded(self, response, keyword, error_message: str):
         if response.status_code == 200:
-            items = response.json()
-
-            self.table.setRowCount(len(items))
+            self.active_keyword = keyword
+            self.fill_table(response.json())
 
-            for row, item in enumerate(items):
-                self.table.setItem(row, 0, QTableWidgetItem(str(item['item_number'])))
-                self.table.setItem(row, 1, QTableWidgetItem(item['purchase_date']))
-                self.table.setItem(row, 2, QTableWidgetItem(item['item_name']))
-                self.table.setItem(row, 3, QTableWidgetItem(str(item['cost_per_item'])))
-                self.table.setItem(row, 4, QTableWidgetItem(str(item['number_of_items'])))
-                self.table.setItem(row, 5, QTableWidgetItem(str(item['total_cost'])))
-                self.table.setItem(row, 6, QTableWidgetItem(str(item['current_price'])))
-                self.table.setItem(row, 7, QTableWidgetItem(str(item['total_value'])))
-                self.table.setItem(row, 8, QTableWidgetItem(str(item['total_return_dollar'])))
-
-            # Calculate updated statistics based on filtered items
-            self.calculate_and_update_statistics(items)
+            # Update statistics based on the items shown
+            self.update_statistics(self.active_keyword)
 
         else:
-            self.show_error_popup('Error', 'An error occurred while searching items.')
+            self.show_error_popup('Error', error_message)
+
+    def search_items(self):
+        keyword = self.text_input.text()
+        self.load(f'{ITEMS_URL}/search', {'keyword': keyword}, keyword or None,
+                  'An error occurred while searching items.')
 
     def clear_search(self):
         self.text_input.clear()
         self.update_table()
 
-    def update_table(self):
-        response = get(ITEMS_URL)
-        if response.status_code == 200:
-            items = response.json()
-
-            self.table.setRowCount(len(items))
-
-            for row, item in enumerate(items):
-                self.table.setItem(row, 0, QTableWidgetItem(str(item['item_number'])))
-                self.table.setItem(row, 1, QTableWidgetItem(item['purchase_date']))
-                self.table.setItem(row, 2, QTableWidgetItem(item['item_name']))
-                self.table.setItem(row, 3, QTableWidgetItem(str(item['cost_per_item'])))
-                self.table.setItem(row, 4, QTableWidgetItem(str(item['number_of_items'])))
-                self.table.setItem(row, 5, QTableWidgetItem(str(item['total_cost'])))
-                self.table.setItem(row, 6, QTableWidgetItem(str(item['current_price'])))
-                self.table.setItem(row, 7, QTableWidgetItem(str(item['total_value'])))
-                self.table.setItem(row, 8, QTableWidgetItem(str(item['total_return_dollar'])))
+    def set_grouped(self, grouped: bool):
+        self.grouped = grouped
+        # Positions cover the whole inventory; searching works on the individual lots
+        for widget in (self.text_input, self.search_button, self.clear_button):
+            widget.setEnabled(not grouped)
+        model = self.position_model if grouped else self.table_model
+        self.proxy_model.setSourceModel(model)
+        if grouped:
+            self.active_keyword = None
+            self.table.sortByColumn(model.fields.index('total_value'), Qt.DescendingOrder)
+        else:
+            self.table.sortByColumn(0, Qt.AscendingOrder)
+        self.reload()
 
-            # Calculate updated statistics based on all items
-            self.calculate_and_update_statistics(items)
+    def update_positions(self):
+        self.load(POSITIONS_URL, None, None, 'An error occurred while fetching positions.')
 
+    def reload(self):
+        if self.grouped:
+            self.update_positions()
+        elif self.active_keyword:
+            self.search_items()
         else:
-            self.show_error_popup('Error', 'An error occurred while fetching items.')
+            self.update_table()
 
-    def update_statistics(self):
-        response = get(ITEMS_URL)
+    def update_table(self):
+        self.load(ITEMS_URL, None, None, 'An error occurred while fetching items.')
+
+    def fill_table(self, items):
+        (self.position_model if self.grouped else self.table_model).set_items(items)
+
+    def apply_event(self, event: dict):
+        event_type = event['type']
+        if event_type == 'refresh.progress':
+            self.refresh_progress.emit(event['job'])
+            return
+        if event_type == 'resync':
+            self.reload()
+            return
+        if self.grouped:
+            self.positions_timer.start()
+            self.stats_timer.start()
+            return
+
+        if event_type == 'item.deleted':
+            self.table_model.remove_item(event['item_number'])
+        else:
+            item = event['item']
+            # New rows only show up in the unfiltered view; a search has to be re-run to include them
+            if self.table_model.has_item(item['item_number']) or \
+                    (event_type == 'item.created' and not self.active_keyword):
+                self.table_model.upsert_item(item)
+        self.stats_timer.start()
+
+    def closeEvent(self, event):
+        self.event_stream.stop()
+        self.api.shutdown()
+        super().closeEvent(event)
+
+    def update_statistics(self, keyword: str = None):
+        params = {'keyword': keyword} if keyword else None
+        if self.pending_stats is not None:
+            self.pending_stats.cancel()
+        self.pending_stats = self.api.get(
+            SUMMARY_URL, params=params, on_success=self.show_statistics,
+            on_error=lambda error: self.show_error_popup('Error', f'An error occurred while fetching statistics.\n{error}'),
+        )
+
+    def show_statistics(self, response):
         if response.status_code == 200:
-            items = response.json()
+            summary = response.json()
 
-            total_cost = sum(item['total_cost'] for item in items)
-            total_value = sum(item['total_value'] for item in items)
-            total_return_dollar = sum(item['total_return_dollar'] for item in items)
-            total_return_percent = (total_return_dollar / total_cost) * 100 if total_cost != 0 else 0
-
-            self.total_cost_value.setText('${:,.2f}'.format(total_cost))
-            self.total_value_value.setText('${:,.2f}'.format(total_value))
-            self.total_return_dollar_value.setText('${:,.2f}'.format(total_return_dollar))
-            self.total_return_percent_value.setText('{}%'.format(round(total_return_percent)))
+            self.total_cost_value.setText('${:,.2f}'.format(summary['total_cost']))
+            self.total_value_value.setText('${:,.2f}'.format(summary['total_value']))
+            self.total_return_dollar_value.setText('${:,.2f}'.format(summary['total_return_dollar']))
+            self.total_return_percent_value.setText('{}%'.format(round(summary['total_return_percent'])))
 
         else:
             self.show_error_popup('Error', 'An error occurred while fetching statistics.')
 
-    def calculate_and_update_statistics(self, items):
-        total_cost = sum(item['total_cost'] for item in items)
-        total_value = sum(item['total_value'] for item in items)
-        total_return_dollar = sum(item['total_return_dollar'] for item in items)
-        total_return_percent = (total_return_dollar / total_cost) * 100 if total_cost != 0 else 0
-
-        self.total_cost_value.setText('${:,.2f}'.format(total_cost))
-        self.total_value_value.setText('${:,.2f}'.format(total_value))
-        self.total_return_dollar_value.setText('${:,.2f}'.format(total_return_dollar))
-        self.total_return_percent_value.setText('{}%'.format(round(total_return_percent)))
-
     def open_add_item_window(self):
         add_item_window = AddItemWindow(self)
         add_item_window.show()
 
+    def selected_item_numbers(self) -> List[int]:
+        if self.grouped:
+            # Grouped rows are positions, not lots, so there are no item numbers to pass on
+            return []
+        rows = self.table.selectionModel().selectedRows()
+        numbers = (self.table_model.item_number(self.proxy_model.mapToSource(row).row()) for row in rows)
+        return sorted(number for number in numbers if number is not None)
+
     def open_update_item_window(self):
-        update_item_window = UpdateItemWindow(self)
+        update_item_window = UpdateItemWindow(self, self.selected_item_numbers())
         update_item_window.show()
 
     def open_update_prices_window(self):
@@ -220,7 +345,7 @@ class MainWindow(QMainWindow):
         update_prices_window.show()
 
     def open_delete_item_window(self):
-        delete_item_window = DeleteItemWindow(self)
+        delete_item_window = DeleteItemWindow(self, self.selected_item_numbers())
         delete_item_window.show()
 
     def show_error_popup(self, title: str, message: str):
@@ -262,6 +387,8 @@ class AddItemWindow(QMainWindow):
         self.setCentralWidget(self.central_widget)
 
         self.add_button.clicked.connect(self.add_item)
+        self.cancel_button.clicked.connect(self.close)
+        self.pending = None
 
     def add_item(self):
         item_link = self.item_link_input.text()
@@ -274,31 +401,42 @@ class AddItemWindow(QMainWindow):
             "cost_per_item": float(cost_per_item)
         }
 
-        response = post(ADD_ITEM_URL, json=payload)
+        # Adding an item looks its price up on Steam, which can take a while
+        self.add_button.setEnabled(False)
+        self.pending = self.parent().api.post(ADD_ITEM_URL, json=payload, on_success=self.on_added,
+                                              on_error=self.on_failed)
+
+    def on_added(self, response):
         if response.status_code == 200:
             QMessageBox.information(self, 'Success', 'Item added successfully.')
             self.close()
-            self.parent().update_table()
         else:
-            self.show_error_popup('Error', 'An error occurred while adding the item.')
+            self.on_failed(response.text)
+
+    def on_failed(self, error: str):
+        self.add_button.setEnabled(True)
+        self.show_error_popup('Error', f'An error occurred while adding the item.\n{error}')
+
+    def closeEvent(self, event):
+        if self.pending is not None:
+            self.pending.cancel()
+        super().closeEvent(event)
 
     def show_error_popup(self, title: str, message: str):
         QMessageBox.critical(self, title, message)
 
 
 class UpdateItemWindow(QMainWindow):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, item_numbers: List[int] = ()):
         super().__init__(parent)
 
-        self.item_number = None
-
         self.setWindowTitle('Update Item')
         self.setGeometry(200, 200, 400, 250)
 
         self.central_widget = QWidget(self)
 
-        self.item_number_label = QLabel('Item Number:', self.central_widget)
-        self.item_number_input = QLineEdit(self.central_widget)
+        self.item_number_label = QLabel('Item Numbers (comma separated):', self.central_widget)
+        self.item_number_input = QLineEdit(", ".join(map(str, item_numbers)), self.central_widget)
 
         self.item_name_label = QLabel('Item Name:', self.central_widget)
         self.item_name_input = QLineEdit(self.central_widget)
@@ -338,9 +476,15 @@ class UpdateItemWindow(QMainWindow):
         self.setCentralWidget(self.central_widget)
 
         self.update_button.clicked.connect(self.update_item)
+        self.cancel_button.clicked.connect(self.close)
+        self.pending = None
 
     def update_item(self):
-        item_number = self.item_number_input.text()
+        try:
+            item_numbers = parse_item_numbers(self.item_number_input.text())
+        except ValueError:
+            self.show_error_popup('Error', 'Item numbers must be whole numbers separated by commas.')
+            return
         item_name = self.item_name_input.text()
         number_of_items = self.number_of_items_input.text()
         cost_per_item = self.cost_per_item_input.text()
@@ -364,34 +508,31 @@ class UpdateItemWindow(QMainWindow):
         if purchase_date:
             payload["purchase_date"] = purchase_date
 
-        response = put(f"http://127.0.0.1:8000/items/{item_number}", json=payload)
+        # The same changes go to every listed item in a single request and transaction
+        changes = [{"item_number": item_number, **payload} for item_number in item_numbers]
+        self.update_button.setEnabled(False)
+        self.pending = self.parent().api.patch(ITEMS_URL, json=changes, on_success=self.on_updated,
+                                               on_error=self.on_failed)
+
+    def on_updated(self, response):
         if response.status_code == 200:
-            QMessageBox.information(self, 'Success', 'Item updated successfully.')
+            QMessageBox.information(self, 'Success', f'{len(response.json())} item(s) updated successfully.')
             self.close()
-            self.parent().update_table()
         else:
-            self.show_error_popup('Error', 'An error occurred while updating the item.')
-
-
-            response = post(f"http://127.0.0.1:8000/update/{item_number}", json=payload)
-            if response.status_code == 200:
-                QMessageBox.information(self, 'Success', 'Item updated successfully.')
-                self.close()
-                self.parent().update_table()
-                self.parent().update_statistics()
-            else:
-                self.show_error_popup('Error', 'An error occurred while updating the item.')
+            self.on_failed(response.text)
 
+    def on_failed(self, error: str):
+        self.update_button.setEnabled(True)
+        self.show_error_popup('Error', f'An error occurred while updating the item.\n{error}')
 
+    def closeEvent(self, event):
+        if self.pending is not None:
+            self.pending.cancel()
+        super().closeEvent(event)
 
     def show_error_popup(self, title: str, message: str):
         QMessageBox.critical(self, title, message)
 
-# Define the custom event class
-class UpdateCompleteEvent(QEvent):
-    def __init__(self):
-        super().__init__(QEvent.User)
-
 class UpdatePricesWindow(QMainWindow):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -417,67 +558,72 @@ class UpdatePricesWindow(QMainWindow):
         
 
         self.update_button.clicked.connect(self.execute_update_prices)
-    
+
+        # Progress is pushed by the server through the main window's event stream
+        self.job_id = None
+        self.api = parent.api
+        parent.refresh_progress.connect(self.show_progress)
 
     def execute_update_prices(self):
         self.progress_bar.setValue(0)
         self.progress_bar.setMaximum(100)
 
-        response = get(ITEMS_URL)
-        if response.status_code == 200:
-            items = response.json()
-            total_items = len(items)
-            if total_items > 0:
-                increment = 100 / total_items
-                thread = threading.Thread(target=self.update_prices_thread, args=(items, increment))
-                thread.start()
-            else:
-                QMessageBox.information(self, 'No Items', 'No items to update.')
+        self.update_button.setEnabled(False)
+        self.api.post(REFRESH_URL, on_success=self.on_started, on_error=self.on_failed)
+
+    def on_started(self, response):
+        if response.status_code == 202:
+            self.job_id = response.json()['job_id']
+
+            # Catch up on anything published before job_id was known
+            self.api.get(f'{REFRESH_URL}/{self.job_id}', on_success=self.on_status)
         else:
-            self.show_error_popup('Error', 'An error occurred while updating prices.')
+            self.on_failed(response.text)
 
-    def update_prices_thread(self, items, increment):
-        for index, item in enumerate(items):
-            # Update progress bar
-            self.progress_bar.setValue(int((index + 1) * increment))
+    def on_status(self, response):
+        if response.status_code == 200:
+            self.show_progress(response.json())
 
-            # Update item price
-            item_id = item['item_number']  # Adjust the key name if needed
-            response = post(f'http://127.0.0.1:8000/update/{item_id}')
-            if response.status_code != 200:
-                self.show_error_popup('Error', f'Failed to update price for item: {item_id}')
+    def on_failed(self, error: str):
+        self.update_button.setEnabled(True)
+        self.show_error_popup('Error', f'An error occurred while updating prices.\n{error}')
 
-            # Delay before the next request
-            time.sleep(3.5)
+    def show_progress(self, job: dict):
+        if job['job_id'] != self.job_id:
+            return
 
-        QCoreApplication.postEvent(self, UpdateCompleteEvent())
+        if job['total_items'] > 0:
+            self.progress_bar.setValue(int(job['progress'] * 100 / job['total_items']))
 
-    def customEvent(self, event):
-        if isinstance(event, UpdateCompleteEvent):
+        if job['status'] == 'completed':
+            self.job_id = None
+            if job['failed']:
+                self.show_error_popup('Error', f"Failed to update prices for {job['failed']} items.")
             self.update_complete()
+        elif job['status'] == 'failed':
+            self.job_id = None
+            self.show_error_popup('Error', f"Price refresh failed: {job['error']}")
+            self.update_button.setEnabled(True)
 
     def update_complete(self):
         # Perform actions when the update process is complete
         QMessageBox.information(self, 'Update Complete', 'Prices updated successfully.')
         self.close()
-        self.parent().update_table()
 
     def show_error_popup(self, title: str, message: str):
         QMessageBox.critical(self, title, message)
 
 class DeleteItemWindow(QMainWindow):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, item_numbers: List[int] = ()):
         super().__init__(parent)
 
-        self.item_number = None
-
         self.setWindowTitle('Delete Item')
         self.setGeometry(200, 200, 400, 150)
 
         self.central_widget = QWidget(self)
 
-        self.item_number_label = QLabel('Item Number:', self.central_widget)
-        self.item_number_input = QLineEdit(self.central_widget)
+        self.item_number_label = QLabel('Item Numbers (comma separated):', self.central_widget)
+        self.item_number_input = QLineEdit(", ".join(map(str, item_numbers)), self.central_widget)
 
         self.delete_button = QPushButton('Delete', self.central_widget)
         self.cancel_button = QPushButton('Cancel', self.central_widget)
@@ -492,17 +638,35 @@ class DeleteItemWindow(QMainWindow):
         self.setCentralWidget(self.central_widget)
 
         self.delete_button.clicked.connect(self.delete_item)
+        self.cancel_button.clicked.connect(self.close)
+        self.pending = None
 
     def delete_item(self):
-        item_number = self.item_number_input.text()
+        try:
+            item_numbers = parse_item_numbers(self.item_number_input.text())
+        except ValueError:
+            self.show_error_popup('Error', 'Item numbers must be whole numbers separated by commas.')
+            return
+
+        self.delete_button.setEnabled(False)
+        self.pending = self.parent().api.delete(ITEMS_URL, json={"item_numbers": item_numbers},
+                                                on_success=self.on_deleted, on_error=self.on_failed)
 
-        response = delete(f"{ITEMS_URL}/{item_number}")
+    def on_deleted(self, response):
         if response.status_code == 200:
-            QMessageBox.information(self, 'Success', 'Item deleted successfully.')
+            QMessageBox.information(self, 'Success', response.json()["message"])
             self.close()
-            self.parent().update_table()
         else:
-            self.show_error_popup('Error', 'An error occurred while deleting the item.')
+            self.on_failed(response.text)
+
+    def on_failed(self, error: str):
+        self.delete_button.setEnabled(True)
+        self.show_error_popup('Error', f'An error occurred while deleting the item.\n{error}')
+
+    def closeEvent(self, event):
+        if self.pending is not None:
+            self.pending.cancel()
+        super().closeEvent(event)
 
     def show_error_popup(self, title: str, message: str):
         QMessageBox.critical(self, title, message)
@@ -1,25 +1,20 @@
 from urllib.parse import unquote
-from urllib import request
-import json
 
-def name_finder(item_link: str) -> str:
-    item_name = item_link[47:]
-    return unquote(item_name)
+WEARS = ["Factory New", "Minimal Wear", "Field-Tested", "Well-Worn", "Battle-Scarred"]
+
 
-def price_finder(item_link: str) -> int:
-    # Implement logic to retrieve and return the item's price
-    try:
-        market_hash_name = item_link[47:]
-        target_url = "https://steamcommunity.com/market/priceoverview/?appid=730&currency=1&market_hash_name=" \
-                    + market_hash_name
-        url_request = request.urlopen(target_url)
-        data = json.loads(url_request.read().decode())
-        item_price = str(data.get('lowest_price'))
-        item_price = float(item_price.replace('$', ''))
-    except:
-        item_price = 0
+def market_hash_name(item_link: str) -> str:
+    return item_link[47:]
 
-    return item_price
 
+def name_finder(item_link: str) -> str:
+    return unquote(market_hash_name(item_link))
 
 
+def parse_item_name(item_name: str) -> dict:
+    wear = next((wear for wear in WEARS if item_name.endswith(f"({wear})")), None)
+    return {
+        "wear": wear,
+        "stattrak": "StatTrak" in item_name,
+        "souvenir": item_name.startswith("Souvenir"),
+    }
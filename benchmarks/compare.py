@@ -0,0 +1,48 @@
+"""Compare two benchmark reports written by benchmarks/run.py.
+
+Usage: python benchmarks/compare.py BASELINE.json CANDIDATE.json [--threshold 0.2]
+
+Prints the median of every benchmark in both reports with the change between them, and exits
+with status 1 if any benchmark got slower by more than the threshold (a fraction; 0.2 is 20%).
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as report_file:
+        return json.load(report_file)
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> list:
+    regressions = []
+    print(f"baseline {baseline['meta'].get('commit')}  candidate {candidate['meta'].get('commit')}")
+    print(f"{'size':>8}  {'benchmark':<64} {'baseline':>11} {'candidate':>11} {'change':>8}")
+    for size, results in candidate["results"].items():
+        for name, result in results.items():
+            before = baseline["results"].get(size, {}).get(name)
+            after_ms = result["median_ms"]
+            if before is None:
+                print(f"{size:>8}  {name:<64} {'-':>11} {after_ms:>9.1f}ms {'new':>8}")
+                continue
+            before_ms = before["median_ms"]
+            change = (after_ms - before_ms) / before_ms if before_ms else 0.0
+            flag = " !" if change > threshold else ""
+            print(f"{size:>8}  {name:<64} {before_ms:>9.1f}ms {after_ms:>9.1f}ms {change:>+7.0%}{flag}")
+            if change > threshold:
+                regressions.append((size, name, change))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    regressions = compare(load(args.baseline), load(args.candidate), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmarks regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
@@ -0,0 +1,106 @@
+"""Generate a synthetic inventory database for benchmarking.
+
+Usage: python benchmarks/generate.py ROWS PATH [--catalogue 2000] [--seed 1]
+
+Lots are drawn from a catalogue of distinct market items, so like a real inventory many lots share an
+item_link. The schema, triggers and search index come from the app's own models.
+"""
+import argparse
+import random
+import sqlite3
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from urllib.parse import quote
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from models import Base  # noqa: E402
+from utils import WEARS  # noqa: E402
+
+LISTING_URL = "https://steamcommunity.com/market/listings/730/"
+WEAPONS = ["AK-47", "M4A4", "M4A1-S", "AWP", "Desert Eagle", "USP-S", "Glock-18", "P250", "FAMAS", "Galil AR",
+           "MP9", "MAC-10", "UMP-45", "P90", "SSG 08", "Five-SeveN", "Tec-9", "CZ75-Auto", "Nova", "XM1014"]
+SKINS = ["Redline", "Asiimov", "Hyper Beast", "Vulcan", "Fire Serpent", "Neo-Noir", "Printstream", "Bloodsport",
+         "Case Hardened", "Fade", "Slate", "Phantom Disruptor", "Neon Rider", "Wasteland Rebel", "Cyrex",
+         "Dragon Lore", "Blaze", "Kill Confirmed", "Fever Dream", "Ice Coaled"]
+
+INSERT_SQL = """
+INSERT INTO inventory (purchase_date, item_name, cost_per_item, number_of_items, total_cost, current_price,
+                       total_value, total_return_dollar, total_return_percent, item_link, last_priced_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
+"""
+
+
+def catalogue_names(size: int, rng: random.Random) -> list:
+    names = set()
+    while len(names) < size:
+        skin = rng.choice(SKINS)
+        if len(names) >= len(WEAPONS) * len(SKINS) * len(WEARS):
+            # The word lists run out of combinations; numbered variants keep names distinct
+            skin = f"{skin} {rng.randint(2, size)}"
+        name = f"{rng.choice(WEAPONS)} | {skin} ({rng.choice(WEARS)})"
+        if rng.random() < 0.2:
+            name = f"StatTrak™ {name}"
+        elif rng.random() < 0.05:
+            name = f"Souvenir {name}"
+        names.add(name)
+    return sorted(names)
+
+
+def generate_rows(rows: int, names: list, rng: random.Random):
+    first_day = date(2020, 1, 1)
+    for _ in range(rows):
+        name = rng.choice(names)
+        cost = round(rng.uniform(0.05, 500), 2)
+        price = round(cost * rng.uniform(0.3, 3), 2)
+        count = rng.randint(1, 25)
+        total_cost, total_value = round(cost * count, 2), round(price * count, 2)
+        total_return = round(total_value - total_cost, 2)
+        yield (
+            (first_day + timedelta(days=rng.randint(0, 1500))).isoformat(), name, cost, count, total_cost, price,
+            total_value, total_return, round(total_return / total_cost * 100, 2), LISTING_URL + quote(name),
+        )
+
+
+def generate_inventory(path: str, rows: int, catalogue: int = 2000, seed: int = 1, chunk_size: int = 50000):
+    # A WAL file left next to a fresh database would be replayed into it
+    for suffix in ("", "-wal", "-shm"):
+        Path(path + suffix).unlink(missing_ok=True)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    rng = random.Random(seed)
+    names = catalogue_names(min(catalogue, rows), rng)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        chunk = []
+        for row in generate_rows(rows, names, rng):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                conn.executemany(INSERT_SQL, chunk)
+                chunk.clear()
+        if chunk:
+            conn.executemany(INSERT_SQL, chunk)
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        conn.close()
+    return names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic inventory database")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--catalogue", type=int, default=2000, help="distinct market items to draw lots from")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate_inventory(args.path, args.rows, args.catalogue, args.seed)
+    print(f"Wrote {args.rows} rows to {args.path}")
@@ -0,0 +1,412 @@
+"""Benchmark the API, the price refresh and the Qt table against synthetic inventories.
+
+Usage: python benchmarks/run.py [--sizes 1000,10000,100000] [--repeat 5] [--output report.json]
+                                [--latency 0] [--readers 4] [--write-seconds 10] [--skip-ui]
+                                [--skip-refresh] [--creates 16] [--create-latency 0.5]
+
+For each size a fresh inventory is generated into a scratch directory. Then:
+- every read endpoint is timed through the ASGI app,
+- applying a new price to every lot, as a refresh does, is timed,
+- a full price refresh runs against fake_price_server.py on a free local port,
+- reader threads time queries while another process keeps repricing every row, to show how much
+  long write transactions stall readers,
+- reads are timed on the event loop with and without creates waiting on a slow price provider,
+- MainWindow table population is timed under the Qt offscreen platform.
+
+Pass 1000000 in --sizes for the 1M row run; generating it takes a couple of minutes. Compare two
+reports with benchmarks/compare.py, e.g. a run with SQLITE_JOURNAL_MODE=delete against the WAL default.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "app"))
+
+
+def summarize(timings: list) -> dict:
+    timings = sorted(timings)
+    return {
+        "repeat": len(timings),
+        "min_ms": round(timings[0], 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "p99_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+        "max_ms": round(timings[-1], 3),
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return summarize(timings)
+
+
+def start_price_stub(latency: float) -> ThreadingHTTPServer:
+    import fake_price_server
+
+    # A handler class per stub, since the options live on the class
+    options = argparse.Namespace(
+        latency=latency, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1, quiet=True)
+    handler = type("PriceStubHandler", (fake_price_server.FakePriceHandler,), {"options": options})
+    server = ThreadingHTTPServer(("localhost", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def checked(client, url: str, **params):
+    def request():
+        response = client.get(url, params=params)
+        assert response.status_code == 200, f"{url} returned {response.status_code}: {response.text[:200]}"
+        return response
+    return request
+
+
+def bench_endpoints(client, size: int, repeat: int) -> dict:
+    middle = size // 2
+    item_number = random.Random(size).randint(1, size)
+    heavy = max(1, repeat // 3)
+    cases = {
+        "GET /items?limit=100": (checked(client, "/items", limit=100), repeat),
+        "GET /items?after=middle&limit=100": (checked(client, "/items", after=middle, limit=100), repeat),
+        "GET /items?sort=total_value&order=desc&limit=50":
+            (checked(client, "/items", sort="total_value", order="desc", limit=50), repeat),
+        "GET /items?min_total_value=1000&sort=purchase_date&limit=100":
+            (checked(client, "/items", min_total_value=1000, sort="purchase_date", limit=100), repeat),
+        "GET /items?fields=item_number,total_value&format=ndjson":
+            (checked(client, "/items", fields="item_number,total_value", format="ndjson"), heavy),
+        "GET /items": (checked(client, "/items"), heavy),
+        "GET /items?format=csv": (checked(client, "/items", format="csv"), heavy),
+        "GET /items/{item_number}": (checked(client, f"/items/{item_number}"), repeat),
+        "GET /items/search?keyword=redline": (checked(client, "/items/search", keyword="redline"), heavy),
+        "GET /items/search?keyword=ak&wear=Field-Tested&limit=100":
+            (checked(client, "/items/search", keyword="ak", wear="Field-Tested", limit=100), repeat),
+        "GET /portfolio/summary": (checked(client, "/portfolio/summary"), repeat),
+        "GET /portfolio/summary?keyword=redline": (checked(client, "/portfolio/summary", keyword="redline"), repeat),
+        "GET /items/{item_number}/history": (checked(client, f"/items/{item_number}/history"), repeat),
+    }
+    return {name: measure(fn, count) for name, (fn, count) in cases.items()}
+
+
+def bench_calculated_fields(size: int, repeat: int) -> dict:
+    from models import Inventory
+    from services import update_calculated_fields
+
+    items = [Inventory(number_of_items=3, cost_per_item=1.25, current_price=2.5) for _ in range(min(size, 100000))]
+
+    def recalculate():
+        for item in items:
+            update_calculated_fields(item)
+
+    return {f"update_calculated_fields x{len(items)}": measure(recalculate, repeat)}
+
+
+def bench_apply_prices(repeat: int) -> dict:
+    # Every lot gets a new price on each pass, the most rows a refresh can rewrite
+    from database import SessionLocal
+    from models import Inventory
+    from refresh import apply_prices
+
+    db = SessionLocal()
+    links = [link for (link,) in db.query(Inventory.item_link).distinct()]
+    passes = iter(range(1, repeat + 2))
+
+    def apply():
+        step = next(passes)
+        apply_prices(db, [(link, 1 + (index + step) % 5000 / 100) for index, link in enumerate(links)])
+
+    try:
+        return {"apply_prices (every lot repriced)": measure(apply, repeat)}
+    finally:
+        db.close()
+
+
+def bench_refresh() -> dict:
+    from price_cache import price_cache
+    from refresh import RefreshJob, run_refresh
+
+    price_cache.invalidate()
+    job = RefreshJob()
+    started = time.perf_counter()
+    run_refresh(job)
+    elapsed = (time.perf_counter() - started) * 1000
+    assert job.status == "completed", job.error
+    return {"refresh": {
+        "repeat": 1, "min_ms": round(elapsed, 3), "median_ms": round(elapsed, 3), "mean_ms": round(elapsed, 3),
+        "max_ms": round(elapsed, 3), "items": job.total_items, "failed": job.failed,
+    }}
+
+
+def reprice_all(stop, commits):
+    # Runs in its own process, like a refresh in another worker, so readers only share the database locks
+    # with it and not the GIL. Every transaction rewrites every row, the longest commit a refresh makes.
+    from sqlalchemy import func, update
+    from database import SessionLocal
+    from models import Inventory
+    from services import calculated_field_values
+
+    inventory = Inventory.__table__
+    db = SessionLocal()
+    while not stop.is_set():
+        db.execute(update(inventory).values(current_price=func.round(inventory.c.current_price * 1.001, 2)))
+        db.execute(update(inventory).values(calculated_field_values()))
+        db.commit()
+        commits.value += 1
+    db.close()
+
+
+def bench_reads_during_writes(client, size: int, readers: int, seconds: float) -> dict:
+    cases = {
+        "GET /items?after=random&limit=100": lambda rng: checked(client, "/items", after=rng.randint(1, size), limit=100),
+        "GET /portfolio/summary": lambda rng: checked(client, "/portfolio/summary"),
+    }
+    timings = {name: [] for name in cases}
+    errors = {name: 0 for name in cases}
+    context = multiprocessing.get_context("spawn")
+    stop, commits = context.Event(), context.Value("i", 0)
+    writer = context.Process(target=reprice_all, args=(stop, commits))
+    writer.start()
+
+    def reader(seed: int):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            for name, case in cases.items():
+                started = time.perf_counter()
+                try:
+                    case(rng)()
+                except Exception:
+                    # "database is locked" once the busy timeout runs out: the reader stalled for all of it
+                    errors[name] += 1
+                timings[name].append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=reader, args=(seed,)) for seed in range(readers)]
+    # Let the writer get its first transaction going before the clock starts
+    while commits.value == 0 and writer.is_alive():
+        time.sleep(0.01)
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    writer.join()
+    return {f"{name} during writes": {**summarize(values), "errors": errors[name], "writer_commits": commits.value}
+            for name, values in timings.items() if values}
+
+
+async def time_reads(client, size: int, readers: int, seconds: float) -> dict:
+    cases = {
+        "GET /items/{item_number}": lambda rng: f"/items/{rng.randint(1, size)}",
+        "GET /portfolio/summary": lambda rng: "/portfolio/summary",
+    }
+    timings = {name: [] for name in cases}
+    deadline = time.perf_counter() + seconds
+
+    async def reader(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            for name, url in cases.items():
+                started = time.perf_counter()
+                response = await client.get(url(rng))
+                assert response.status_code == 200, f"{url(rng)} returned {response.status_code}"
+                timings[name].append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(reader(seed) for seed in range(readers)))
+    return {name: summarize(values) for name, values in timings.items()}
+
+
+async def bench_reads_during_creates(app, size: int, readers: int, creates: int, seconds: float) -> dict:
+    # Every create is for a new market item, so it misses the quote cache and waits on the provider
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    created = 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = {f"{name} idle": result for name, result in (await time_reads(client, size, readers, seconds)).items()}
+        stop = asyncio.Event()
+
+        async def creator(worker: int):
+            nonlocal created
+            while not stop.is_set():
+                name = f"Bench Create {worker}-{created}"
+                response = await client.post("/items/", json={
+                    "item_link": f"https://steamcommunity.com/market/listings/730/{name.replace(' ', '%20')}",
+                    "cost_per_item": 1.0, "number_of_items": 1, "purchase_date": "01/01/2023"})
+                assert response.status_code == 200, f"POST /items/ returned {response.status_code}"
+                created += 1
+
+        tasks = [asyncio.create_task(creator(worker)) for worker in range(creates)]
+        during = await time_reads(client, size, readers, seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+    results.update({f"{name} during creates": {**result, "creates": created} for name, result in during.items()})
+    return results
+
+
+def bench_ui(client, repeat: int) -> dict:
+    import orjson
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtWidgets import QApplication
+    from ui import MainWindow
+
+    app = QApplication.instance() or QApplication([])
+    window = MainWindow()
+    # The benchmark feeds the table directly; there is no server for the event stream to reach
+    window.event_stream.stop()
+    items = orjson.loads(client.get("/items").content)
+
+    def populate():
+        window.fill_table(items)
+        app.processEvents()
+
+    def sort():
+        window.table.sortByColumn(7, Qt.DescendingOrder)
+        app.processEvents()
+        window.table.sortByColumn(0, Qt.AscendingOrder)
+        app.processEvents()
+
+    heavy = max(1, repeat // 3)
+    results = {
+        "MainWindow.fill_table": measure(populate, heavy),
+        "MainWindow sort by total_value and back": measure(sort, heavy),
+    }
+    window.close()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated inventory sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--catalogue", type=int, default=2000, help="distinct market items in each inventory")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the price stub waits per request")
+    parser.add_argument("--output", default="benchmark-report.json")
+    parser.add_argument("--skip-ui", action="store_true")
+    parser.add_argument("--skip-refresh", action="store_true")
+    parser.add_argument("--readers", type=int, default=4, help="threads reading while another process writes")
+    parser.add_argument("--write-seconds", type=float, default=10.0, help="how long the readers and writer overlap")
+    parser.add_argument("--creates", type=int, default=16, help="concurrent creates while reads are timed")
+    parser.add_argument("--create-latency", type=float, default=0.5, help="seconds the price stub waits per create")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    output = Path(args.output).resolve()
+
+    stub = start_price_stub(args.latency)
+    slow_stub = start_price_stub(args.create_latency)
+    os.environ.update({
+        "SCHEDULER_ENABLED": "false",
+        "PRICE_PROVIDER_URL": f"http://localhost:{stub.server_port}/market/priceoverview/",
+        # Measure the refresh engine itself rather than the politeness limits used against Steam
+        "REFRESH_RATE": "100000",
+        "REFRESH_BURST": "100000",
+        "PRICE_CACHE_SIZE": str(max(10000, args.catalogue)),
+    })
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    # Point the app at a scratch database before anything imports its settings
+    scratch = tempfile.mkdtemp(prefix="inventory-bench-")
+    db_path = os.path.join(scratch, "inv_sqldatabase.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from generate import generate_inventory
+    generate_inventory(db_path, 1)
+
+    from fastapi.testclient import TestClient
+    import server
+    from config import settings
+    from database import SessionLocal, async_engine, engine
+    from price_provider import price_provider
+    from price_history import record_price
+    from utils import market_hash_name
+
+    client = TestClient(server.app)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "catalogue": args.catalogue,
+            "latency": args.latency,
+            "database": engine.dialect.name,
+            "sqlite_journal_mode": settings.sqlite_journal_mode,
+            "sqlite_synchronous": settings.sqlite_synchronous,
+        },
+        "results": {},
+    }
+
+    for size in sizes:
+        print(f"Generating {size} rows", flush=True)
+        # Pooled connections would keep reading the file generate_inventory is about to replace
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+        started = time.perf_counter()
+        generate_inventory(db_path, size, args.catalogue)
+        results = {"generate": {"repeat": 1, "median_ms": round((time.perf_counter() - started) * 1000, 3)}}
+
+        # A month of hourly quotes for every item, so the history endpoint has something to read
+        db = SessionLocal()
+        now = int(time.time())
+        for item_link in {link for (link,) in db.execute("SELECT item_link FROM inventory LIMIT 20")}:
+            for hour in range(24 * 30):
+                record_price(db, market_hash_name(item_link), 1 + hour % 7, now - hour * 3600)
+        db.commit()
+        db.close()
+
+        print(f"Timing endpoints at {size} rows", flush=True)
+        results.update(bench_endpoints(client, size, args.repeat))
+        results.update(bench_calculated_fields(size, args.repeat))
+        results.update(bench_apply_prices(args.repeat))
+        if not args.skip_refresh:
+            print(f"Refreshing {size} rows", flush=True)
+            results.update(bench_refresh())
+        print(f"Reading {size} rows while another process rewrites them", flush=True)
+        results.update(bench_reads_during_writes(client, size, args.readers, args.write_seconds))
+        print(f"Reading {size} rows while creates wait on a slow price provider", flush=True)
+        price_provider.base_url = f"http://localhost:{slow_stub.server_port}/market/priceoverview/"
+        results.update(asyncio.run(bench_reads_during_creates(server.app, size, args.readers, args.creates,
+                                                              args.write_seconds)))
+        price_provider.base_url = os.environ["PRICE_PROVIDER_URL"]
+        if not args.skip_ui:
+            print(f"Populating the table with {size} rows", flush=True)
+            results.update(bench_ui(client, args.repeat))
+        report["results"][str(size)] = results
+
+    stub.shutdown()
+    slow_stub.shutdown()
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
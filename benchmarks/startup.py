@@ -0,0 +1,88 @@
+"""Measure how long the API server takes to import, and fail when it goes over budget.
+
+Usage: python benchmarks/startup.py [--repeat 5] [--budget-ms 2000] [--top 15] [--output startup.json]
+
+Each run imports server (the headless API application) in a fresh interpreter under python -X importtime,
+against a scratch database. The median total import time is checked against --budget-ms, and none of
+the modules that are only needed by the UI or by particular requests may be imported at all. Exits with
+status 1 if either check fails, so it can gate CI. --output writes a report benchmarks/compare.py reads.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+from run import git_commit, summarize
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Loaded on first use: Qt by the UI process only, the rest by the first request that needs them
+DEFERRED_MODULES = ["PyQt5", "numpy", "pyarrow", "httpx"]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_server(scratch: str) -> list:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(scratch, 'inv_sqldatabase.db')}",
+               SCHEDULER_ENABLED="false", PYTHONPATH=str(ROOT / "app"))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"], cwd=ROOT / "app",
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"import server failed:\n{result.stderr[-2000:]}")
+    # (self microseconds, cumulative microseconds, module)
+    return [(int(match[1]), int(match[2]), match[4])
+            for match in map(IMPORTTIME_LINE.match, result.stderr.splitlines()) if match]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the API server's imports against a budget")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2000.0, help="allowed median import time of server")
+    parser.add_argument("--top", type=int, default=15, help="modules to list by their own import time")
+    parser.add_argument("--output", help="write a report for benchmarks/compare.py")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="inventory-startup-")
+    # The first import writes the bytecode cache; it is not part of a cold start of an existing install
+    import_server(scratch)
+
+    totals, own_time = [], defaultdict(list)
+    imported = set()
+    for _ in range(args.repeat):
+        rows = import_server(scratch)
+        totals.append(next(cumulative for _, cumulative, name in rows if name == "server") / 1000)
+        for own, _, name in rows:
+            own_time[name].append(own / 1000)
+            imported.add(name.split(".")[0])
+
+    startup = summarize(totals)
+    print(f"import server: median {startup['median_ms']:.1f}ms, max {startup['max_ms']:.1f}ms "
+          f"over {args.repeat} runs (budget {args.budget_ms:.0f}ms)")
+    print(f"\n{'module':<48} {'own ms':>8}")
+    slowest = sorted(own_time.items(), key=lambda item: -sorted(item[1])[len(item[1]) // 2])[:args.top]
+    for name, timings in slowest:
+        print(f"{name:<48} {sorted(timings)[len(timings) // 2]:>8.1f}")
+
+    failures = []
+    if startup["median_ms"] > args.budget_ms:
+        failures.append(f"median import time {startup['median_ms']:.1f}ms is over the {args.budget_ms:.0f}ms budget")
+    failures.extend(f"{module} is imported at startup" for module in DEFERRED_MODULES if module in imported)
+
+    if args.output:
+        report = {"meta": {"commit": git_commit(), "python": sys.version.split()[0], "budget_ms": args.budget_ms},
+                  "results": {"startup": {"import server": startup}}}
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"\nWrote {args.output}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()